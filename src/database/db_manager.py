@@ -8,17 +8,48 @@ import os
 from pathlib import Path
 from datetime import datetime
 from typing import List, Optional
-from sqlalchemy import create_engine, func
+from sqlalchemy import create_engine, func, event, text, insert
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.exc import IntegrityError
 
-from .models import Base, DocParaERP, RegistroResultado
+from .models import Base, DocParaERP, RegistroResultado, MetaCache
 from ..utils.config import get_settings
 from ..utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
 
+def fmt_brl(value) -> str:
+    """Formata valor monetário em Reais (R$) - registada como função SQL `fmt_brl`"""
+    if value is None:
+        return "R$ 0,00"
+    try:
+        return f"R$ {float(value):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+    except (TypeError, ValueError):
+        return "R$ 0,00"
+
+
+# PRAGMAs aplicados a cada conexão (leitura concorrente com o dashboard)
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-65536",     # 64 MB de cache de páginas
+    "PRAGMA mmap_size=268435456",   # 256 MB mapeados em memória
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+def _configurar_conexao(dbapi_connection, connection_record):
+    """Configura PRAGMAs e regista funções SQL auxiliares em cada nova conexão SQLite"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+    dbapi_connection.create_function("fmt_brl", 1, fmt_brl, deterministic=True)
+
+
 class DatabaseManager:
     """Gerenciador do banco de dados SQLite"""
     
@@ -49,10 +80,17 @@ class DatabaseManager:
                 echo=False,
                 connect_args={"check_same_thread": False}
             )
+            event.listen(self._engine, "connect", _configurar_conexao)
             
             # Criar tabelas
             Base.metadata.create_all(bind=self._engine)
             
+            # Índices acrescentados ao modelo depois de a BD existir
+            # (create_all não cria índices em tabelas já existentes)
+            with self._engine.begin() as conn:
+                for index in DocParaERP.__table__.indexes:
+                    index.create(bind=conn, checkfirst=True)
+            
             # Criar SessionLocal
             self._SessionLocal = sessionmaker(
                 autocommit=False,
@@ -66,6 +104,14 @@ class DatabaseManager:
         """Retorna uma nova sessão do banco de dados"""
         return self._SessionLocal()
     
+    @property
+    def engine(self):
+        """
+        Engine partilhada (pool de conexões já configuradas)
+        Para leituras diretas com pandas, sem criar uma sessão ORM
+        """
+        return self._engine
+    
     def add_documento(self, doc_data: dict) -> Optional[int]:
         """
         Adiciona documento à tabela docs_para_erp
@@ -80,6 +126,7 @@ class DatabaseManager:
         try:
             doc = DocParaERP(**doc_data)
             session.add(doc)
+            self._incrementar_versao(session, DocParaERP.__tablename__)
             session.commit()
             session.refresh(doc)
             logger.info(f"Documento adicionado: Número {doc.numero_nf}")
@@ -109,6 +156,7 @@ class DatabaseManager:
         try:
             resultado = RegistroResultado(**resultado_data)
             session.add(resultado)
+            self._incrementar_versao(session, RegistroResultado.__tablename__)
             session.commit()
             session.refresh(resultado)
             logger.info(f"Resultado registrado: {resultado.resultado}")
@@ -120,6 +168,68 @@ class DatabaseManager:
         finally:
             session.close()
     
+    def add_resultados_bulk(self, resultados_data: List[dict]) -> int:
+        """
+        Adiciona vários resultados de processamento numa única transação
+        
+        Args:
+            resultados_data: Lista de dicionários com dados dos resultados
+            
+        Returns:
+            Número de resultados inseridos (0 se erro)
+        """
+        if not resultados_data:
+            return 0
+        
+        session = self.get_session()
+        try:
+            session.execute(insert(RegistroResultado), resultados_data)
+            self._incrementar_versao(session, RegistroResultado.__tablename__)
+            session.commit()
+            logger.info(f"{len(resultados_data)} resultados registrados")
+            return len(resultados_data)
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Erro ao registrar resultados: {e}")
+            return 0
+        finally:
+            session.close()
+    
+    def _incrementar_versao(self, session: Session, tabela: str):
+        """Incrementa a versão de `tabela` na mesma transação da escrita"""
+        session.execute(
+            text(
+                "INSERT INTO cache_meta (tabela, versao) VALUES (:tabela, 1) "
+                "ON CONFLICT(tabela) DO UPDATE SET versao = versao + 1"
+            ),
+            {'tabela': tabela}
+        )
+    
+    def get_versao_dados(self, tabela: str) -> int:
+        """
+        Retorna a versão atual dos dados de uma tabela
+        
+        As páginas incluem este número nas chaves de cache: qualquer escrita
+        na tabela muda a chave e os resultados antigos deixam de ser usados.
+        
+        Args:
+            tabela: Nome da tabela (ex: 'docs_para_erp')
+            
+        Returns:
+            Versão (0 se a tabela nunca foi escrita ou em caso de erro)
+        """
+        session = self.get_session()
+        try:
+            versao = session.query(MetaCache.versao).filter(
+                MetaCache.tabela == tabela
+            ).scalar()
+            return versao or 0
+        except Exception as e:
+            logger.error(f"Erro ao ler versão dos dados de {tabela}: {e}")
+            return 0
+        finally:
+            session.close()
+    
     def check_documento_existe(self, chave_acesso: str) -> bool:
         """
         Verifica se documento já existe no banco
@@ -157,6 +267,31 @@ class DatabaseManager:
         finally:
             session.close()
     
+    def get_documentos_by_chaves(self, chaves: List[str]) -> dict:
+        """
+        Busca vários documentos por chave de acesso numa única consulta
+        
+        Args:
+            chaves: Lista de chaves de acesso
+            
+        Returns:
+            Dicionário {chave_acesso: path_nome_arquivo} das chaves existentes
+        """
+        if not chaves:
+            return {}
+        
+        session = self.get_session()
+        try:
+            return dict(
+                session.query(
+                    DocParaERP.chave_acesso, DocParaERP.path_nome_arquivo
+                ).filter(
+                    DocParaERP.chave_acesso.in_(set(chaves))
+                ).all()
+            )
+        finally:
+            session.close()
+    
     def get_recent_documents(self, limit: int = 10) -> List[DocParaERP]:
         """
         Retorna documentos mais recentes
@@ -5,7 +5,7 @@ Modelos de dados SQLAlchemy para Fiscalia
 """
 
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Index
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -15,10 +15,16 @@ class DocParaERP(Base):
     """Tabela de documentos fiscais processados"""
     
     __tablename__ = 'docs_para_erp'
+    __table_args__ = (
+        # Índices de cobertura dos rankings/agregações por período (Estatísticas)
+        Index('ix_docs_emitente_periodo_valor', 'razao_social_emitente', 'time_stamp', 'valor_total'),
+        Index('ix_docs_destinatario_periodo_valor', 'razao_social_destinatario', 'time_stamp', 'valor_total'),
+        Index('ix_docs_uf_periodo_valor', 'uf_emitente', 'time_stamp', 'valor_total'),
+    )
     
     # Campos de controle
     id = Column(Integer, primary_key=True, autoincrement=True)
-    time_stamp = Column(DateTime, default=datetime.now, nullable=False)
+    time_stamp = Column(DateTime, default=datetime.now, nullable=False, index=True)
     path_nome_arquivo = Column(String(500), nullable=False)
     erp_processado = Column(String(3), default='No', nullable=False)  # Yes/No
     
@@ -88,3 +94,15 @@ class RegistroResultado(Base):
     
     def __repr__(self):
         return f"<RegistroResultado(arquivo={self.path_nome_arquivo}, resultado={self.resultado})>"
+
+
+class MetaCache(Base):
+    """Versão dos dados de cada tabela - incrementada a cada escrita para invalidar caches das páginas"""
+    
+    __tablename__ = 'cache_meta'
+    
+    tabela = Column(String(50), primary_key=True)
+    versao = Column(Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f"<MetaCache(tabela={self.tabela}, versao={self.versao})>"
@@ -4,7 +4,7 @@ Usa BD para controle de duplicados
 """
 
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import hashlib
 from datetime import datetime
 
@@ -57,42 +57,33 @@ class NFeProcessor:
             logger.error(f"Erro ao calcular hash: {e}")
             return ""
     
-    def _verificar_duplicado_antes_salvar(self, conteudo_bytes: bytes) -> tuple[bool, str]:
+    def _verificar_duplicado_antes_salvar(self, conteudo_bytes: bytes, nome_arquivo: str) -> tuple[bool, str]:
         """Verifica se arquivo já existe antes de salvar"""
         try:
-            hash_arquivo = hashlib.md5(conteudo_bytes).hexdigest()
-            
-            temp_dir = Path(self.settings.pasta_base) / "temp"
-            temp_dir.mkdir(exist_ok=True)
-            
-            temp_path = temp_dir / f"temp_{hash_arquivo}.xml"
-            temp_path.write_bytes(conteudo_bytes)
-            
-            try:
-                if self.xml_processor.load_xml(temp_path):
-                    dados = self.xml_processor.extract_data()
-                    chave_acesso = dados.get('metadata', {}).get('chave_acesso', '')
-                    
-                    if chave_acesso and self.db.check_documento_existe(chave_acesso):
-                        logger.warning(f"Arquivo duplicado detectado ANTES de salvar: {chave_acesso}")
-                        return True, chave_acesso
-                    
-                    return False, chave_acesso
-                else:
-                    return False, ""
+            # Parse direto dos bytes em memória (sem ficheiro temporário);
+            # o nome só identifica o upload nos logs
+            if self.xml_processor.load_xml(Path(nome_arquivo), conteudo_bytes):
+                dados = self.xml_processor.extract_data()
+                chave_acesso = dados.get('metadata', {}).get('chave_acesso', '')
+                
+                if chave_acesso and self.db.check_documento_existe(chave_acesso):
+                    logger.warning(f"Arquivo duplicado detectado ANTES de salvar: {chave_acesso}")
+                    return True, chave_acesso
                 
-            finally:
-                if temp_path.exists():
-                    temp_path.unlink()
+                return False, chave_acesso
+            else:
+                return False, ""
                     
         except Exception as e:
             logger.error(f"Erro ao verificar duplicado: {e}")
             return False, ""
+        finally:
+            self.xml_processor.descarregar()
     
-    def _extrair_dados_do_xml(self, arquivo_path: Path) -> Dict[str, Any]:
-        """Extrai dados do XML e converte para formato do banco"""
+    def _extrair_dados_do_xml(self, arquivo_path: Path, conteudo: Optional[bytes] = None) -> Dict[str, Any]:
+        """Extrai dados do XML e converte para formato do banco (conteudo evita reler o ficheiro)"""
         try:
-            if not self.xml_processor.load_xml(arquivo_path):
+            if not self.xml_processor.load_xml(arquivo_path, conteudo):
                 logger.error(f"Falha ao carregar XML: {arquivo_path.name}")
                 return {}
             
@@ -152,9 +143,29 @@ class NFeProcessor:
         except Exception as e:
             logger.error(f"Erro ao extrair dados do XML {arquivo_path.name}: {e}")
             return {}
+        finally:
+            self.xml_processor.descarregar()
+    
+    def _registrar_resultado(self, resultados_pendentes: Optional[list], resultado_data: dict):
+        """Grava o resultado na BD ou acumula-o em resultados_pendentes"""
+        if resultados_pendentes is None:
+            self.db.add_resultado(resultado_data)
+        else:
+            resultados_pendentes.append({'time_stamp': datetime.now(), **resultado_data})
     
-    def process_file(self, arquivo_path: Path) -> Dict[str, Any]:
-        """Processa um arquivo XML de NFe"""
+    def process_file(self, arquivo_path: Path, conteudo: Optional[bytes] = None,
+                     resultados_pendentes: Optional[list] = None) -> Dict[str, Any]:
+        """
+        Processa um arquivo XML de NFe
+        
+        Args:
+            arquivo_path: Caminho do arquivo XML
+            conteudo: Bytes do arquivo, se já estão em memória (uploads);
+                o XML é lido daí em vez de ser relido do disco
+            resultados_pendentes: Lista onde acumular o registo do resultado,
+                gravado depois em lote por quem chama (add_resultados_bulk);
+                sem lista, o resultado é gravado logo
+        """
         try:
             logger.info(f"Processando arquivo: {arquivo_path.name}")
             
@@ -169,7 +180,7 @@ class NFeProcessor:
             if not self.file_handler.validar_extensao(arquivo_path):
                 self.file_handler.processar_arquivo_invalido(arquivo_path)
                 
-                self.db.add_resultado({
+                self._registrar_resultado(resultados_pendentes, {
                     'path_nome_arquivo': str(arquivo_path),
                     'resultado': 'Insucesso',
                     'causa': 'Extensão inválida'
@@ -182,12 +193,12 @@ class NFeProcessor:
                 }
             
             # Extrair dados
-            dados = self._extrair_dados_do_xml(arquivo_path)
+            dados = self._extrair_dados_do_xml(arquivo_path, conteudo)
             
             if not dados or not dados.get('chave_acesso'):
                 self.file_handler.move_to_rejeitados(arquivo_path, "XML inválido")
                 
-                self.db.add_resultado({
+                self._registrar_resultado(resultados_pendentes, {
                     'path_nome_arquivo': str(arquivo_path),
                     'resultado': 'Insucesso',
                     'causa': 'XML inválido ou sem chave de acesso'
@@ -206,7 +217,7 @@ class NFeProcessor:
                 
                 self.file_handler.move_to_rejeitados(arquivo_path, "Documento duplicado")
                 
-                self.db.add_resultado({
+                self._registrar_resultado(resultados_pendentes, {
                     'path_nome_arquivo': str(arquivo_path),
                     'resultado': 'Insucesso',
                     'causa': f'Documento duplicado: {chave_acesso}'
@@ -227,7 +238,7 @@ class NFeProcessor:
             if doc_id:
                 self.file_handler.move_to_processados(arquivo_path)
                 
-                self.db.add_resultado({
+                self._registrar_resultado(resultados_pendentes, {
                     'path_nome_arquivo': str(arquivo_path),
                     'resultado': 'Sucesso',
                     'causa': f"NFe {dados.get('numero_nf')} processada com sucesso"
@@ -244,7 +255,7 @@ class NFeProcessor:
             else:
                 self.file_handler.move_to_rejeitados(arquivo_path, "Erro no banco de dados")
                 
-                self.db.add_resultado({
+                self._registrar_resultado(resultados_pendentes, {
                     'path_nome_arquivo': str(arquivo_path),
                     'resultado': 'Insucesso',
                     'causa': f"Erro ao processar {arquivo_path.name}"
@@ -262,7 +273,7 @@ class NFeProcessor:
             try:
                 self.file_handler.move_to_rejeitados(arquivo_path, f"Erro: {str(e)}")
                 
-                self.db.add_resultado({
+                self._registrar_resultado(resultados_pendentes, {
                     'path_nome_arquivo': str(arquivo_path),
                     'resultado': 'Insucesso',
                     'causa': f"Erro no processamento: {str(e)}"
@@ -278,10 +289,27 @@ class NFeProcessor:
     
     def process_uploaded_file(self, uploaded_file, nome_arquivo: str) -> Dict[str, Any]:
         """Processa arquivo do Streamlit file_uploader"""
+        return self.process_uploaded_bytes(uploaded_file.getvalue(), nome_arquivo)
+    
+    def process_uploaded_bytes(self, conteudo: bytes, nome_arquivo: str,
+                               duplicado_verificado: bool = False,
+                               resultados_pendentes: Optional[list] = None) -> Dict[str, Any]:
+        """
+        Processa conteúdo de um upload já lido em memória (sem file-like)
+        
+        Args:
+            conteudo: Bytes do XML
+            nome_arquivo: Nome do ficheiro
+            duplicado_verificado: True se quem chama já verificou a chave na BD;
+                evita o parse extra da verificação antes de salvar
+                (process_file continua a rejeitar duplicados)
+            resultados_pendentes: Ver process_file
+        """
         try:
-            conteudo = uploaded_file.getbuffer().tobytes()
-            
-            is_duplicado, chave_acesso = self._verificar_duplicado_antes_salvar(conteudo)
+            if duplicado_verificado:
+                is_duplicado, chave_acesso = False, ""
+            else:
+                is_duplicado, chave_acesso = self._verificar_duplicado_antes_salvar(conteudo, nome_arquivo)
             
             if is_duplicado:
                 logger.warning(f"Upload bloqueado - arquivo duplicado: {nome_arquivo}")
@@ -296,7 +324,7 @@ class NFeProcessor:
             temp_path = Path(self.settings.pasta_entrados) / nome_arquivo
             temp_path.write_bytes(conteudo)
             
-            return self.process_file(temp_path)
+            return self.process_file(temp_path, conteudo, resultados_pendentes)
             
         except Exception as e:
             logger.error(f"Erro ao processar upload: {e}")
@@ -3,7 +3,7 @@ Processador de arquivos XML de documentos fiscais
 Suporta NFe, NFCe, CTe e MDFe
 """
 
-import xml.etree.ElementTree as ET
+from lxml import etree
 from pathlib import Path
 from typing import Dict, List, Any, Optional
 from datetime import datetime
@@ -20,25 +20,43 @@ class XMLProcessor:
     def __init__(self):
         """Inicializa o processador XML"""
         self.current_file: Optional[Path] = None
-        self.xml_root: Optional[ET.Element] = None
-        self.root: Optional[ET.Element] = None  # Alias para compatibilidade
-        self.tree: Optional[ET.ElementTree] = None
+        self.conteudo: Optional[bytes] = None  # Bytes do XML, se carregado da memória
+        self.xml_root: Optional[etree._Element] = None
+        self.root: Optional[etree._Element] = None  # Alias para compatibilidade
+        self.tree: Optional[etree._ElementTree] = None
         self.doc_type: Optional[str] = None
         self.ns: Dict[str, str] = {}  # Namespace (vazio por padrão)
+        
+        # Parser criado uma vez e reutilizado em todos os ficheiros desta instância
+        # (sem recover: XML mal formado continua a ser rejeitado; sem entidades,
+        # DTD ou rede; huge_tree desligado mantém os limites de segurança do libxml2)
+        self._parser = etree.XMLParser(
+            resolve_entities=False,
+            load_dtd=False,
+            no_network=True,
+            remove_blank_text=True,
+            collect_ids=False,
+        )
     
-    def load_xml(self, file_path: Path) -> bool:
+    def load_xml(self, file_path: Path, conteudo: Optional[bytes] = None) -> bool:
         """
         Carrega arquivo XML
         
         Args:
             file_path: Caminho do arquivo XML
+            conteudo: Bytes do XML já lidos (ex: upload); se indicado, o
+                ficheiro não é relido do disco (nem para o parse nem para o hash)
             
         Returns:
             True se carregou com sucesso, False caso contrário
         """
         try:
             self.current_file = file_path
-            self.tree = ET.parse(file_path)
+            self.conteudo = conteudo
+            if conteudo is not None:
+                self.tree = etree.fromstring(conteudo, self._parser).getroottree()
+            else:
+                self.tree = etree.parse(str(file_path), self._parser)
             self.xml_root = self.tree.getroot()
             self.root = self.xml_root  # Alias para compatibilidade
             
@@ -61,6 +79,18 @@ class XMLProcessor:
             logger.error(f"Erro ao carregar XML {file_path}: {e}")
             return False
     
+    def descarregar(self):
+        """
+        Liberta o XML carregado (bytes e árvore)
+        
+        O processador é reutilizado entre ficheiros: sem isto, os bytes e a
+        árvore do último XML ficam em memória até ao próximo load_xml
+        """
+        self.conteudo = None
+        self.tree = None
+        self.xml_root = None
+        self.root = None
+    
     def _detect_doc_type(self) -> str:
         """
         Detecta tipo de documento fiscal
@@ -112,6 +142,9 @@ class XMLProcessor:
     
     def calculate_file_hash(self) -> str:
         """Calcula hash SHA256 do arquivo"""
+        if self.conteudo is not None:
+            return hashlib.sha256(self.conteudo).hexdigest()
+        
         if not self.current_file or not self.current_file.exists():
             return ''
         
@@ -338,7 +371,7 @@ class XMLProcessor:
             logger.warning(f"Erro ao extrair {path}: {e}")
             return default
     
-    def _get_text_from_element(self, element: ET.Element, path: str, default: str = '') -> str:
+    def _get_text_from_element(self, element: etree._Element, path: str, default: str = '') -> str:
         """Extrai texto de sub-elemento"""
         try:
             if self.ns:
@@ -359,7 +392,7 @@ class XMLProcessor:
         except (ValueError, TypeError):
             return default
     
-    def _get_decimal_from_element(self, element: ET.Element, path: str, default: float = 0.0) -> float:
+    def _get_decimal_from_element(self, element: etree._Element, path: str, default: float = 0.0) -> float:
         """Extrai decimal de sub-elemento"""
         text = self._get_text_from_element(element, path)
         try:
@@ -367,7 +400,7 @@ class XMLProcessor:
         except (ValueError, TypeError):
             return default
     
-    def _find_all(self, tag: str) -> List[ET.Element]:
+    def _find_all(self, tag: str) -> List[etree._Element]:
         """Busca todos elementos com determinada tag"""
         try:
             if self.ns:
@@ -0,0 +1,62 @@
+"""
+Análise do texto de SQL direto (página Consultas)
+Funções puras, sem Streamlit nem BD: dividir statements, identificar o tipo
+e reescrever `SELECT *` para uma projeção de colunas
+"""
+
+import re
+from typing import Iterable, List
+
+
+# `SELECT * FROM docs_para_erp` no início da consulta
+RE_SELECT_TODOS = re.compile(r'^\s*SELECT\s+\*(\s+FROM\s+docs_para_erp\b)', re.IGNORECASE)
+
+# Primeira palavra-chave de uma statement, saltando espaços e comentários iniciais.
+# Repetição possessiva (*+): depois de consumir o prefixo não há retrocesso para
+# dentro dele - tempo linear em qualquer entrada e nunca devolve uma palavra
+# de dentro de um comentário
+RE_PRIMEIRA_PALAVRA = re.compile(r'(?:\s+|--[^\n]*|/\*.*?\*/)*+(\w+)', re.DOTALL)
+
+
+def dividir_sql(consulta: str) -> List[str]:
+    """
+    Divide o texto em statements num único varrimento, sem contar os ';'
+    que estejam dentro de literais ('...', "...") ou comentários (--, /* */)
+    """
+    statements = []
+    inicio = i = 0
+    n = len(consulta)
+    while i < n:
+        c = consulta[i]
+        if c == "'" or c == '"':
+            fim = consulta.find(c, i + 1)
+            # Aspas duplicadas ('') fazem parte do literal
+            while fim != -1 and consulta.startswith(c, fim + 1):
+                fim = consulta.find(c, fim + 2)
+            i = n if fim == -1 else fim + 1
+        elif consulta.startswith('--', i):
+            fim = consulta.find('\n', i)
+            i = n if fim == -1 else fim + 1
+        elif consulta.startswith('/*', i):
+            fim = consulta.find('*/', i + 2)
+            i = n if fim == -1 else fim + 2
+        elif c == ';':
+            statements.append(consulta[inicio:i])
+            inicio = i = i + 1
+        else:
+            i += 1
+    statements.append(consulta[inicio:])
+    return [stmt.strip() for stmt in statements if stmt.strip()]
+
+
+def tipo_statement(statement: str) -> str:
+    """Primeira palavra-chave da statement em maiúsculas ('' se não houver)"""
+    m = RE_PRIMEIRA_PALAVRA.match(statement)
+    return m.group(1).upper() if m else ''
+
+
+def projetar_colunas(consulta: str, colunas: Iterable[str]) -> str:
+    """Troca `SELECT *` sobre docs_para_erp pelas `colunas` indicadas"""
+    return RE_SELECT_TODOS.sub(
+        lambda m: f"SELECT {', '.join(colunas)}{m.group(1)}", consulta, count=1
+    )
@@ -9,7 +9,7 @@ import streamlit as st
 import sys
 from pathlib import Path
 import pandas as pd
-import plotly.express as px
+import re
 from datetime import datetime, timedelta
 from sqlalchemy import text
 import os
@@ -33,6 +33,7 @@ for path in [str(root_path), str(src_path)]:
 # Agora importar
 try:
     from src.database.db_manager import DatabaseManager
+    from src.utils.sql_direto import dividir_sql, tipo_statement, projetar_colunas
     from streamlit_app.components.common import show_header, show_success, show_error, show_info
 except ImportError:
     # Fallback se estiver em ambiente diferente
@@ -44,6 +45,13 @@ except ImportError:
         spec.loader.exec_module(db_manager)
         DatabaseManager = db_manager.DatabaseManager
     
+    spec = importlib.util.spec_from_file_location("sql_direto", root_path / 'src' / 'utils' / 'sql_direto.py')
+    sql_direto = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(sql_direto)
+    dividir_sql, tipo_statement, projetar_colunas = (
+        sql_direto.dividir_sql, sql_direto.tipo_statement, sql_direto.projetar_colunas
+    )
+    
     # Fallback para components
     def show_header(title, subtitle=""):
         st.title(title)
@@ -65,29 +73,95 @@ show_header("Consultas Inteligentes", "Análises com SQL direto ou perguntas em
 
 # ==================== FUNÇÕES AUXILIARES ====================
 
+# Documentos do período selecionado - fragmento comum a todas as perguntas.
+# Os limites são passados como parâmetros (:data_inicio, :data_fim), o que
+# mantém o texto da query constante e evita repetir o filtro em cada SELECT.
+CTE_PERIODO = """
+        WITH periodo AS (
+            SELECT *
+            FROM docs_para_erp
+            WHERE data_emissao BETWEEN :data_inicio AND :data_fim
+        )"""
+
+# Todos os agregados escalares do período numa única query (botão "Visão Geral").
+# As perguntas escalares (1 a 5) reutilizam este resultado quando já carregado.
+QUERY_VISAO_GERAL = f"""{CTE_PERIODO}
+        SELECT 
+            COUNT(*) as n_notas,
+            SUM(valor_total) as soma_valor,
+            AVG(valor_total) as media_valor,
+            MIN(valor_total) as min_valor,
+            MAX(valor_total) as max_valor,
+            SUM(CASE WHEN valor_desconto > 0 THEN valor_desconto END) as soma_desconto,
+            AVG(CASE WHEN valor_desconto > 0 THEN valor_desconto END) as media_desconto,
+            COUNT(CASE WHEN valor_desconto > 0 THEN 1 END) as n_com_desconto,
+            SUM(valor_icms) as soma_icms,
+            SUM(valor_ipi) as soma_ipi,
+            SUM(valor_pis) as soma_pis,
+            SUM(valor_cofins) as soma_cofins,
+            SUM(valor_icms + valor_ipi + valor_pis + valor_cofins) as soma_impostos
+        FROM periodo
+        """
+
+# SQL direto: `SELECT * FROM docs_para_erp` é reescrito para esta projeção (projetar_colunas)
+COLUNAS_RESUMO = (
+    'numero_nf', 'data_emissao', 'razao_social_emitente',
+    'uf_emitente', 'valor_total', 'erp_processado'
+)
+
+# SQL direto: resultados com LIMIT acima deste valor são lidos em blocos
+LINHAS_POR_BLOCO = 2000
+RE_LIMIT = re.compile(r'\bLIMIT\s+(\d+)', re.IGNORECASE)
+
 @st.cache_resource
 def get_db():
     """Retorna instância do DatabaseManager (cria BD automaticamente)"""
     return DatabaseManager()
 
-def executar_query(query: str) -> pd.DataFrame:
-    """Executa query SQL e retorna DataFrame"""
+def _ler_sql(query: str, params: dict = None) -> pd.DataFrame:
+    """Lê o resultado de uma query SQL para DataFrame (propaga exceções)"""
+    # Conexão emprestada do pool da engine e devolvida no fim da leitura
+    return pd.read_sql_query(text(query), get_db().engine, params=params)
+
+@st.cache_data(ttl=1, show_spinner=False)
+def versao_dados() -> int:
+    """Versão atual de docs_para_erp (muda a cada upload)"""
+    return get_db().get_versao_dados('docs_para_erp')
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _ler_sql_cache(query: str, params: dict = None, versao: int = 0) -> pd.DataFrame:
+    """
+    Versão de _ler_sql com cache de 5 minutos, chaveada por (query, params, versao)
+    `versao` (de versao_dados) faz um upload invalidar os resultados anteriores
+    """
+    return _ler_sql(query, params)
+
+def executar_query(query: str, params: dict = None) -> pd.DataFrame:
+    """Executa query SQL (com parâmetros opcionais) e retorna DataFrame"""
     try:
-        db = get_db()
-        session = db.get_session()
-        
-        # Envolver query em text()
-        if isinstance(query, str):
-            query = text(query)
-        
-        df = pd.read_sql_query(query, session.bind)
-        session.close()
+        # Leituras (mesmo com comentários iniciais) usam a cache
+        if tipo_statement(query) in ('SELECT', 'WITH'):
+            return _ler_sql_cache(query, params, versao_dados())
         
-        return df
+        # Comandos de escrita invalidam os resultados em cache
+        _ler_sql_cache.clear()
+        return _ler_sql(query, params)
     except Exception as e:
         st.error(f"❌ Erro ao executar consulta: {e}")
         return pd.DataFrame()
 
+def ler_query_em_blocos(query: str, linhas: int = LINHAS_POR_BLOCO):
+    """Gera o resultado da query em DataFrames de `linhas` registos (sem cache)"""
+    with get_db().engine.connect() as conn:
+        yield from pd.read_sql_query(text(query), conn, chunksize=linhas)
+
+@st.cache_data(ttl=60, show_spinner=False)
+def contar_documentos(versao: int = 0) -> int:
+    """Total de documentos na BD (indicador da sidebar, cache de 1 minuto ou até novo upload)"""
+    # COUNT(*) exato: o SQLite resolve-o pelo índice mais pequeno (chave_acesso),
+    # sem ler as linhas da tabela. MAX(rowid) seria aproximado após exclusões.
+    return int(_ler_sql("SELECT COUNT(*) as total FROM docs_para_erp")['total'].iloc[0])
+
 def format_currency(value) -> str:
     """Formata valor monetário em Reais (R$)"""
     try:
@@ -97,6 +171,37 @@ def format_currency(value) -> str:
     except:
         return "R$ 0,00"
 
+
+def format_currency_series(valores: pd.Series) -> pd.Series:
+    """Versão vetorizada de format_currency para uma coluna inteira"""
+    texto = pd.to_numeric(valores, errors='coerce').fillna(0).map('{:,.2f}'.format)
+    return 'R$ ' + (
+        texto.str.replace(',', 'X', regex=False)
+             .str.replace('.', ',', regex=False)
+             .str.replace('X', '.', regex=False)
+    )
+
+
+def carregar_visao_geral(data_inicio: str, data_fim: str) -> pd.DataFrame:
+    """
+    Carrega todos os agregados escalares do período numa só ida à BD
+    e guarda-os em session_state para as perguntas seguintes
+    """
+    df = executar_query(QUERY_VISAO_GERAL, {'data_inicio': data_inicio, 'data_fim': data_fim})
+    if not df.empty:
+        st.session_state['visao_geral'] = {'periodo': (data_inicio, data_fim, versao_dados()), 'df': df}
+    return df
+
+def ler_visao_geral(data_inicio: str, data_fim: str, colunas: dict):
+    """
+    Devolve as colunas pedidas da visão geral já carregada para o período,
+    renomeadas conforme `colunas` ({nome_agregado: nome_resultado}), ou None
+    """
+    visao = st.session_state.get('visao_geral')
+    if not visao or visao['periodo'] != (data_inicio, data_fim, versao_dados()):
+        return None
+    return visao['df'][list(colunas)].rename(columns=colunas)
+
 def criar_botoes_exportacao(df: pd.DataFrame, prefixo: str = "consulta"):
     """
     Cria botões de exportação para CSV e Excel
@@ -109,7 +214,10 @@ def criar_botoes_exportacao(df: pd.DataFrame, prefixo: str = "consulta"):
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     
     with col_exp1:
-        csv = df.to_csv(index=False).encode('utf-8')
+        # Escrever diretamente em bytes, por blocos, sem string CSV intermédia
+        csv_buffer = BytesIO()
+        df.to_csv(csv_buffer, index=False, encoding='utf-8', chunksize=10_000)
+        csv = csv_buffer.getvalue()
         st.download_button(
             label="📥 Baixar CSV",
             data=csv,
@@ -133,24 +241,61 @@ def criar_botoes_exportacao(df: pd.DataFrame, prefixo: str = "consulta"):
             use_container_width=True
         )
 
+def exibir_resultado(query: str, resposta: str, df_resultado: pd.DataFrame, prefixo: str):
+    """
+    Exibe resposta, dados, gráfico, exportação e SQL de uma pergunta processada
+    """
+    if not query:
+        st.warning(resposta)
+        return
+    
+    st.markdown("---")
+    st.markdown("### 💬 Resposta")
+    st.markdown(resposta)
+    
+    # Mostrar DataFrame se houver
+    if not df_resultado.empty:
+        st.markdown("#### 📊 Dados Detalhados")
+        st.dataframe(df_resultado, width="stretch", hide_index=True, height=400)
+        
+        # Gráfico se for numérico
+        if len(df_resultado) > 1 and 'valor_total' in df_resultado.columns:
+            st.markdown("#### 📈 Visualização")
+            import plotly.express as px  # import tardio: só carrega plotly quando há gráfico
+            fig = px.bar(
+                df_resultado.head(15),
+                x=df_resultado.columns[0],
+                y='valor_total',
+                title='Distribuição de Valores'
+            )
+            st.plotly_chart(fig, width="stretch")
+        
+        # Botões de exportação
+        criar_botoes_exportacao(df_resultado, prefixo)
+    
+    # Mostrar SQL usado (opcional)
+    with st.expander("🔍 Ver SQL Gerado"):
+        st.code(query, language="sql")
+
 def processar_pergunta_natural(pergunta: str, data_inicio: str, data_fim: str) -> tuple:
     """
     Processa pergunta em linguagem natural e retorna (query_sql, resposta_texto, dataframe)
     """
     pergunta_lower = pergunta.lower()
     
-    # Filtro de período
-    filtro_periodo = f"data_emissao BETWEEN '{data_inicio}' AND '{data_fim}'"
+    # Parâmetros do período (aplicados uma única vez na CTE `periodo`)
+    params = {'data_inicio': data_inicio, 'data_fim': data_fim}
     
     # PERGUNTA 1: Quantas notas fiscais?
     if any(word in pergunta_lower for word in ['quantas notas', 'quantas nf', 'total de notas', 'número de notas', 'total de registos', 'quantidade de notas', 'qt notas', 'qtd notas']):
-        query = f"""
+        query = f"""{CTE_PERIODO}
         SELECT COUNT(*) as total_notas,
                SUM(valor_total) as valor_total
-        FROM docs_para_erp
-        WHERE {filtro_periodo}
+        FROM periodo
         """
-        df = executar_query(query)
+        df = ler_visao_geral(data_inicio, data_fim, {'n_notas': 'total_notas', 'soma_valor': 'valor_total'})
+        if df is None:
+            df = executar_query(query, params)
         if not df.empty:
             total = int(df['total_notas'].iloc[0])
             valor = format_currency(df['valor_total'].iloc[0])
@@ -159,15 +304,18 @@ def processar_pergunta_natural(pergunta: str, data_inicio: str, data_fim: str) -
     
     # PERGUNTA 2: Total do valor bruto
     if any(word in pergunta_lower for word in ['total do valor', 'valor bruto', 'valor total', 'soma dos valores', 'total valor', 'quanto foi', 'valor das notas']):
-        query = f"""
+        query = f"""{CTE_PERIODO}
         SELECT 
             SUM(valor_total) as valor_bruto_total,
             AVG(valor_total) as valor_medio,
             COUNT(*) as quantidade_notas
-        FROM docs_para_erp
-        WHERE {filtro_periodo}
+        FROM periodo
         """
-        df = executar_query(query)
+        df = ler_visao_geral(data_inicio, data_fim, {
+            'soma_valor': 'valor_bruto_total', 'media_valor': 'valor_medio', 'n_notas': 'quantidade_notas'
+        })
+        if df is None:
+            df = executar_query(query, params)
         if not df.empty:
             total = format_currency(df['valor_bruto_total'].iloc[0])
             medio = format_currency(df['valor_medio'].iloc[0])
@@ -177,15 +325,19 @@ def processar_pergunta_natural(pergunta: str, data_inicio: str, data_fim: str) -
     
     # PERGUNTA 3: Total de descontos
     if any(word in pergunta_lower for word in ['desconto', 'descontos']):
-        query = f"""
+        query = f"""{CTE_PERIODO}
         SELECT 
             SUM(valor_desconto) as total_desconto,
             AVG(valor_desconto) as media_desconto,
             COUNT(*) as notas_com_desconto
-        FROM docs_para_erp
-        WHERE {filtro_periodo} AND valor_desconto > 0
+        FROM periodo
+        WHERE valor_desconto > 0
         """
-        df = executar_query(query)
+        df = ler_visao_geral(data_inicio, data_fim, {
+            'soma_desconto': 'total_desconto', 'media_desconto': 'media_desconto', 'n_com_desconto': 'notas_com_desconto'
+        })
+        if df is None:
+            df = executar_query(query, params)
         if not df.empty:
             total = format_currency(df['total_desconto'].iloc[0])
             media = format_currency(df['media_desconto'].iloc[0])
@@ -195,17 +347,21 @@ def processar_pergunta_natural(pergunta: str, data_inicio: str, data_fim: str) -
     
     # PERGUNTA 4: Total de impostos
     if any(word in pergunta_lower for word in ['imposto', 'impostos', 'icms', 'ipi', 'pis', 'cofins']):
-        query = f"""
+        query = f"""{CTE_PERIODO}
         SELECT 
             SUM(valor_icms) as total_icms,
             SUM(valor_ipi) as total_ipi,
             SUM(valor_pis) as total_pis,
             SUM(valor_cofins) as total_cofins,
             SUM(valor_icms + valor_ipi + valor_pis + valor_cofins) as total_impostos
-        FROM docs_para_erp
-        WHERE {filtro_periodo}
+        FROM periodo
         """
-        df = executar_query(query)
+        df = ler_visao_geral(data_inicio, data_fim, {
+            'soma_icms': 'total_icms', 'soma_ipi': 'total_ipi', 'soma_pis': 'total_pis',
+            'soma_cofins': 'total_cofins', 'soma_impostos': 'total_impostos'
+        })
+        if df is None:
+            df = executar_query(query, params)
         if not df.empty:
             icms = format_currency(df['total_icms'].iloc[0])
             ipi = format_currency(df['total_ipi'].iloc[0])
@@ -217,16 +373,19 @@ def processar_pergunta_natural(pergunta: str, data_inicio: str, data_fim: str) -
     
     # PERGUNTA 5: Estatísticas de valores
     if any(word in pergunta_lower for word in ['média', 'mediana', 'máximo', 'mínimo', 'estatísticas']):
-        query = f"""
+        query = f"""{CTE_PERIODO}
         SELECT 
             AVG(valor_total) as media,
             MIN(valor_total) as minimo,
             MAX(valor_total) as maximo,
             COUNT(*) as total
-        FROM docs_para_erp
-        WHERE {filtro_periodo}
+        FROM periodo
         """
-        df = executar_query(query)
+        df = ler_visao_geral(data_inicio, data_fim, {
+            'media_valor': 'media', 'min_valor': 'minimo', 'max_valor': 'maximo', 'n_notas': 'total'
+        })
+        if df is None:
+            df = executar_query(query, params)
         if not df.empty:
             media = format_currency(df['media'].iloc[0])
             minimo = format_currency(df['minimo'].iloc[0])
@@ -237,65 +396,59 @@ def processar_pergunta_natural(pergunta: str, data_inicio: str, data_fim: str) -
     
     # PERGUNTA 6: Por destinatário
     if any(word in pergunta_lower for word in ['destinatário', 'destinatarios', 'destinatário', 'cliente', 'clientes', 'top destina', 'top 10 destina', 'destinat']):
-        query = f"""
+        query = f"""{CTE_PERIODO}
         SELECT 
             razao_social_destinatario as 'Destinatário',
             COUNT(*) as 'Quantidade',
             SUM(valor_total) as valor_total,
-            AVG(valor_total) as valor_medio
-        FROM docs_para_erp
-        WHERE {filtro_periodo}
+            fmt_brl(SUM(valor_total)) as 'Valor Total',
+            fmt_brl(AVG(valor_total)) as 'Valor Médio'
+        FROM periodo
         GROUP BY razao_social_destinatario
         ORDER BY valor_total DESC
         LIMIT 10
         """
-        df = executar_query(query)
+        df = executar_query(query, params)
         if not df.empty:
-            df['Valor Total'] = df['valor_total'].apply(format_currency)
-            df['Valor Médio'] = df['valor_medio'].apply(format_currency)
             df_display = df[['Destinatário', 'Quantidade', 'Valor Total', 'Valor Médio']]
             resposta = "📥 **Top 10 Destinatários (por valor total):**"
             return query, resposta, df_display
     
     # PERGUNTA 7: Por emitente/fornecedor
     if any(word in pergunta_lower for word in ['emitente', 'emitentes', 'fornecedor', 'fornecedores', 'top emit', 'top 10 emit', 'emit']):
-        query = f"""
+        query = f"""{CTE_PERIODO}
         SELECT 
             razao_social_emitente as 'Emitente',
             COUNT(*) as 'Quantidade',
             SUM(valor_total) as valor_total,
-            AVG(valor_total) as valor_medio
-        FROM docs_para_erp
-        WHERE {filtro_periodo}
+            fmt_brl(SUM(valor_total)) as 'Valor Total',
+            fmt_brl(AVG(valor_total)) as 'Valor Médio'
+        FROM periodo
         GROUP BY razao_social_emitente
         ORDER BY valor_total DESC
         LIMIT 10
         """
-        df = executar_query(query)
+        df = executar_query(query, params)
         if not df.empty:
-            df['Valor Total'] = df['valor_total'].apply(format_currency)
-            df['Valor Médio'] = df['valor_medio'].apply(format_currency)
             df_display = df[['Emitente', 'Quantidade', 'Valor Total', 'Valor Médio']]
             resposta = "📤 **Top 10 Emitentes/Fornecedores (por valor total):**"
             return query, resposta, df_display
     
     # PERGUNTA 8: Por estado/UF
     if any(word in pergunta_lower for word in ['estado', 'estados', 'uf', 'distribuição', 'distribui', 'por estado', 'quais estados', 'geográfica', 'geografica', 'qual a distribui']):
-        query = f"""
+        query = f"""{CTE_PERIODO}
         SELECT 
             uf_emitente as 'UF',
             COUNT(*) as 'Quantidade',
             SUM(valor_total) as valor_total,
-            AVG(valor_total) as valor_medio
-        FROM docs_para_erp
-        WHERE {filtro_periodo}
+            fmt_brl(SUM(valor_total)) as 'Valor Total',
+            fmt_brl(AVG(valor_total)) as 'Valor Médio'
+        FROM periodo
         GROUP BY uf_emitente
         ORDER BY valor_total DESC
         """
-        df = executar_query(query)
+        df = executar_query(query, params)
         if not df.empty:
-            df['Valor Total'] = df['valor_total'].apply(format_currency)
-            df['Valor Médio'] = df['valor_medio'].apply(format_currency)
             df_display = df[['UF', 'Quantidade', 'Valor Total', 'Valor Médio']]
             resposta = "🗺️ **Distribuição por Estado:**"
             return query, resposta, df_display
@@ -310,60 +463,59 @@ def processar_pergunta_natural(pergunta: str, data_inicio: str, data_fim: str) -
     
     if any(palavra in pergunta_lower for palavra in palavras_erros):
         # Query que verifica MÚLTIPLOS tipos de problemas
-        query = f"""
-        SELECT 
-            'Valores Zerados' as 'Tipo de Problema',
-            COUNT(*) as 'Quantidade'
-        FROM docs_para_erp
-        WHERE {filtro_periodo} AND valor_total = 0
-        UNION ALL
-        SELECT 
-            'Valores Negativos' as 'Tipo de Problema',
-            COUNT(*) as 'Quantidade'
-        FROM docs_para_erp
-        WHERE {filtro_periodo} AND valor_total < 0
-        UNION ALL
-        SELECT 
-            'Sem Emitente' as 'Tipo de Problema',
-            COUNT(*) as 'Quantidade'
-        FROM docs_para_erp
-        WHERE {filtro_periodo} AND (razao_social_emitente IS NULL OR razao_social_emitente = '')
-        UNION ALL
-        SELECT 
-            'Sem Destinatário' as 'Tipo de Problema',
-            COUNT(*) as 'Quantidade'
-        FROM docs_para_erp
-        WHERE {filtro_periodo} AND (razao_social_destinatario IS NULL OR razao_social_destinatario = '')
-        UNION ALL
-        SELECT 
-            'Notas Duplicadas' as 'Tipo de Problema',
-            COUNT(*) as 'Quantidade'
-        FROM (
-            SELECT numero_nf, serie
-            FROM docs_para_erp
-            WHERE {filtro_periodo}
-            GROUP BY numero_nf, serie
-            HAVING COUNT(*) > 1
+        query = f"""{CTE_PERIODO}
+        SELECT * FROM (
+            SELECT 
+                'Valores Zerados' as 'Tipo de Problema',
+                COUNT(*) as 'Quantidade'
+            FROM periodo
+            WHERE valor_total = 0
+            UNION ALL
+            SELECT 
+                'Valores Negativos' as 'Tipo de Problema',
+                COUNT(*) as 'Quantidade'
+            FROM periodo
+            WHERE valor_total < 0
+            UNION ALL
+            SELECT 
+                'Sem Emitente' as 'Tipo de Problema',
+                COUNT(*) as 'Quantidade'
+            FROM periodo
+            WHERE (razao_social_emitente IS NULL OR razao_social_emitente = '')
+            UNION ALL
+            SELECT 
+                'Sem Destinatário' as 'Tipo de Problema',
+                COUNT(*) as 'Quantidade'
+            FROM periodo
+            WHERE (razao_social_destinatario IS NULL OR razao_social_destinatario = '')
+            UNION ALL
+            SELECT 
+                'Notas Duplicadas' as 'Tipo de Problema',
+                COUNT(*) as 'Quantidade'
+            FROM (
+                SELECT numero_nf, serie
+                FROM periodo
+                GROUP BY numero_nf, serie
+                HAVING COUNT(*) > 1
+            )
+            UNION ALL
+            SELECT 
+                'Valores Muito Altos (>R$ 1Mi)' as 'Tipo de Problema',
+                COUNT(*) as 'Quantidade'
+            FROM periodo
+            WHERE valor_total > 1000000
         )
-        UNION ALL
-        SELECT 
-            'Valores Muito Altos (>R$ 1Mi)' as 'Tipo de Problema',
-            COUNT(*) as 'Quantidade'
-        FROM docs_para_erp
-        WHERE {filtro_periodo} AND valor_total > 1000000
+        WHERE "Quantidade" > 0
         """
-        df = executar_query(query)
+        df = executar_query(query, params)
         
+        # A query já devolve apenas problemas reais (quantidade > 0)
         if not df.empty:
-            # Filtrar apenas problemas reais (quantidade > 0)
-            df_problemas = df[df['Quantidade'] > 0]
-            
-            if not df_problemas.empty:
-                total_problemas = int(df_problemas['Quantidade'].sum())
-                resposta = f"⚠️ **Análise de Problemas nas Notas Fiscais:**\n\n**Total de problemas detectados: {total_problemas}**\n\nDetalhes abaixo:"
-                return query, resposta, df_problemas
-            else:
-                resposta = """✅ **Análise Completa: Nenhum Problema Detectado!**
+            total_problemas = int(df['Quantidade'].sum())
+            resposta = f"⚠️ **Análise de Problemas nas Notas Fiscais:**\n\n**Total de problemas detectados: {total_problemas}**\n\nDetalhes abaixo:"
+            return query, resposta, df
+        else:
+            resposta = """✅ **Análise Completa: Nenhum Problema Detectado!**
 
 Todas as notas fiscais estão corretas:
 - ✅ Sem valores zerados ou negativos
@@ -373,22 +525,21 @@ Todas as notas fiscais estão corretas:
 - ✅ Dados consistentes e válidos
 
 O sistema está funcionando perfeitamente! 🎉"""
-                return query, resposta, pd.DataFrame()
+            return query, resposta, pd.DataFrame()
     
     # PERGUNTA 9: Duplicados
     if any(word in pergunta_lower for word in ['duplicado', 'duplicadas', 'repetido', 'repetidas']):
-        query = f"""
+        query = f"""{CTE_PERIODO}
         SELECT 
             numero_nf as 'Número NF',
             serie as 'Série',
             COUNT(*) as 'Ocorrências'
-        FROM docs_para_erp
-        WHERE {filtro_periodo}
+        FROM periodo
         GROUP BY numero_nf, serie
         HAVING COUNT(*) > 1
         ORDER BY COUNT(*) DESC
         """
-        df = executar_query(query)
+        df = executar_query(query, params)
         if not df.empty:
             resposta = f"⚠️ **Notas Duplicadas Encontradas:** {len(df)} casos"
             return query, resposta, df
@@ -398,38 +549,35 @@ O sistema está funcionando perfeitamente! 🎉"""
     
     # PERGUNTA 10: Maiores valores
     if any(word in pergunta_lower for word in ['maiores valores', 'maiores notas', 'top valores', 'notas maiores', 'valores maiores', 'quais as notas', 'quais notas']):
-        query = f"""
+        query = f"""{CTE_PERIODO}
         SELECT 
             numero_nf as 'Número NF',
             razao_social_emitente as 'Emitente',
             razao_social_destinatario as 'Destinatário',
-            valor_total as 'Valor',
+            fmt_brl(valor_total) as 'Valor',
             data_emissao as 'Data'
-        FROM docs_para_erp
-        WHERE {filtro_periodo}
+        FROM periodo
         ORDER BY valor_total DESC
         LIMIT 20
         """
-        df = executar_query(query)
+        df = executar_query(query, params)
         if not df.empty:
-            df['Valor'] = df['Valor'].apply(format_currency)
             resposta = "💰 **Top 20 Notas por Maior Valor:**"
             return query, resposta, df
     
     # PERGUNTA 11: Status ERP
     if any(word in pergunta_lower for word in ['erp', 'processad', 'pendente']):
-        query = f"""
+        query = f"""{CTE_PERIODO}
         SELECT 
             erp_processado as 'Status ERP',
             COUNT(*) as 'Quantidade',
-            SUM(valor_total) as valor_total
-        FROM docs_para_erp
-        WHERE {filtro_periodo}
+            SUM(valor_total) as valor_total,
+            fmt_brl(SUM(valor_total)) as 'Valor Total'
+        FROM periodo
         GROUP BY erp_processado
         """
-        df = executar_query(query)
+        df = executar_query(query, params)
         if not df.empty:
-            df['Valor Total'] = df['valor_total'].apply(format_currency)
             df['Status ERP'] = df['Status ERP'].map({'Yes': '✅ Processado', 'No': '⏳ Pendente'})
             df_display = df[['Status ERP', 'Quantidade', 'Valor Total']]
             resposta = "⚙️ **Status de Processamento ERP:**"
@@ -437,42 +585,39 @@ O sistema está funcionando perfeitamente! 🎉"""
     
     # PERGUNTA 12: Por município
     if any(word in pergunta_lower for word in ['município', 'municipio', 'cidade', 'cidades', 'municípios', 'municipios', 'top 20 munic', 'top munic', 'munic']):
-        query = f"""
+        query = f"""{CTE_PERIODO}
         SELECT 
             municipio_emitente as 'Município',
             uf_emitente as 'UF',
             COUNT(*) as 'Quantidade',
-            SUM(valor_total) as valor_total
-        FROM docs_para_erp
-        WHERE {filtro_periodo}
+            SUM(valor_total) as valor_total,
+            fmt_brl(SUM(valor_total)) as 'Valor Total'
+        FROM periodo
         GROUP BY municipio_emitente, uf_emitente
         ORDER BY valor_total DESC
         LIMIT 20
         """
-        df = executar_query(query)
+        df = executar_query(query, params)
         if not df.empty:
-            df['Valor Total'] = df['valor_total'].apply(format_currency)
             df_display = df[['Município', 'UF', 'Quantidade', 'Valor Total']]
             resposta = "🏙️ **Top 20 Municípios:**"
             return query, resposta, df_display
     
     # PERGUNTA 13: Evolução temporal
     if any(word in pergunta_lower for word in ['evolução', 'evolucao', 'temporal', 'mês', 'mes', 'mensal', 'diária', 'diaria', 'qual a evolu', 'qual evolu']):
-        query = f"""
+        query = f"""{CTE_PERIODO}
         SELECT 
             strftime('%Y-%m', data_emissao) as 'Mês',
             COUNT(*) as 'Quantidade',
             SUM(valor_total) as valor_total,
-            AVG(valor_total) as valor_medio
-        FROM docs_para_erp
-        WHERE {filtro_periodo}
+            fmt_brl(SUM(valor_total)) as 'Valor Total',
+            fmt_brl(AVG(valor_total)) as 'Valor Médio'
+        FROM periodo
         GROUP BY strftime('%Y-%m', data_emissao)
         ORDER BY strftime('%Y-%m', data_emissao)
         """
-        df = executar_query(query)
+        df = executar_query(query, params)
         if not df.empty:
-            df['Valor Total'] = df['valor_total'].apply(format_currency)
-            df['Valor Médio'] = df['valor_medio'].apply(format_currency)
             df_display = df[['Mês', 'Quantidade', 'Valor Total', 'Valor Médio']]
             resposta = "📅 **Evolução Temporal:**"
             return query, resposta, df_display
@@ -480,41 +625,37 @@ O sistema está funcionando perfeitamente! 🎉"""
     # FALLBACK: Tentar detectar intenção por palavras-chave parciais
     # Se tem "maior" ou "alto" → maiores valores
     if ('maior' in pergunta_lower or 'alto' in pergunta_lower) and 'valor' in pergunta_lower:
-        query = f"""
+        query = f"""{CTE_PERIODO}
         SELECT 
             numero_nf as 'Número NF',
             razao_social_emitente as 'Emitente',
             razao_social_destinatario as 'Destinatário',
-            valor_total as 'Valor',
+            fmt_brl(valor_total) as 'Valor',
             data_emissao as 'Data'
-        FROM docs_para_erp
-        WHERE {filtro_periodo}
+        FROM periodo
         ORDER BY valor_total DESC
         LIMIT 20
         """
-        df = executar_query(query)
+        df = executar_query(query, params)
         if not df.empty:
-            df['Valor'] = df['Valor'].apply(format_currency)
             resposta = "💰 **Top 20 Notas por Maior Valor:**"
             return query, resposta, df
     
     # Se tem "menor" ou "baixo" → menores valores
     if ('menor' in pergunta_lower or 'baixo' in pergunta_lower) and 'valor' in pergunta_lower:
-        query = f"""
+        query = f"""{CTE_PERIODO}
         SELECT 
             numero_nf as 'Número NF',
             razao_social_emitente as 'Emitente',
             razao_social_destinatario as 'Destinatário',
-            valor_total as 'Valor',
+            fmt_brl(valor_total) as 'Valor',
             data_emissao as 'Data'
-        FROM docs_para_erp
-        WHERE {filtro_periodo}
+        FROM periodo
         ORDER BY valor_total ASC
         LIMIT 20
         """
-        df = executar_query(query)
+        df = executar_query(query, params)
         if not df.empty:
-            df['Valor'] = df['Valor'].apply(format_currency)
             resposta = "📉 **Top 20 Notas por Menor Valor:**"
             return query, resposta, df
     
@@ -626,6 +767,20 @@ with tab1:
             if st.button("⚠️ Duplicados?", key="ex9"):
                 pergunta_do_botao = "Há notas duplicadas?"
         
+        # Visão geral: todos os agregados do período numa só query
+        if st.button("📋 Visão geral do período", key="ex_visao", width="stretch"):
+            with st.spinner("📊 Calculando visão geral..."):
+                df_visao = carregar_visao_geral(str(data_inicio), str(data_fim))
+            
+            if not df_visao.empty:
+                visao = df_visao.iloc[0]
+                col_v1, col_v2, col_v3, col_v4, col_v5 = st.columns(5)
+                col_v1.metric("📝 Notas", f"{int(visao['n_notas']):,}".replace(",", "."))
+                col_v2.metric("💰 Valor Total", format_currency(visao['soma_valor']))
+                col_v3.metric("📊 Valor Médio", format_currency(visao['media_valor']))
+                col_v4.metric("🧾 Impostos", format_currency(visao['soma_impostos']))
+                col_v5.metric("💸 Descontos", format_currency(visao['soma_desconto']))
+        
         # Se algum botão foi clicado, processar imediatamente
         if pergunta_do_botao:
             st.markdown("---")
@@ -638,35 +793,7 @@ with tab1:
                     str(data_fim)
                 )
                 
-                if query:
-                    st.markdown("---")
-                    st.markdown("### 💬 Resposta")
-                    st.markdown(resposta)
-                    
-                    # Mostrar DataFrame se houver
-                    if not df_resultado.empty:
-                        st.markdown("#### 📊 Dados Detalhados")
-                        st.dataframe(df_resultado, width="stretch", hide_index=True, height=400)
-                        
-                        # Gráfico se for numérico
-                        if len(df_resultado) > 1 and 'valor_total' in df_resultado.columns:
-                            st.markdown("#### 📈 Visualização")
-                            fig = px.bar(
-                                df_resultado.head(15),
-                                x=df_resultado.columns[0],
-                                y='valor_total',
-                                title='Distribuição de Valores'
-                            )
-                            st.plotly_chart(fig, width="stretch")
-                        
-                        # Botões de exportação
-                        criar_botoes_exportacao(df_resultado, "consulta_botao")
-                    
-                    # Mostrar SQL usado (opcional)
-                    with st.expander("🔍 Ver SQL Gerado"):
-                        st.code(query, language="sql")
-                else:
-                    st.warning(resposta)
+                exibir_resultado(query, resposta, df_resultado, "consulta_botao")
     
     st.markdown("---")
     
@@ -688,35 +815,7 @@ with tab1:
                     str(data_fim)
                 )
                 
-                if query:
-                    st.markdown("---")
-                    st.markdown("### 💬 Resposta")
-                    st.markdown(resposta)
-                    
-                    # Mostrar DataFrame se houver
-                    if not df_resultado.empty:
-                        st.markdown("#### 📊 Dados Detalhados")
-                        st.dataframe(df_resultado, width="stretch", hide_index=True, height=400)
-                        
-                        # Gráfico se for numérico
-                        if len(df_resultado) > 1 and 'valor_total' in df_resultado.columns:
-                            st.markdown("#### 📈 Visualização")
-                            fig = px.bar(
-                                df_resultado.head(15),
-                                x=df_resultado.columns[0],
-                                y='valor_total',
-                                title='Distribuição de Valores'
-                            )
-                            st.plotly_chart(fig, width="stretch")
-                        
-                        # Botões de exportação
-                        criar_botoes_exportacao(df_resultado, "consulta_natural")
-                    
-                    # Mostrar SQL usado (opcional)
-                    with st.expander("🔍 Ver SQL Gerado"):
-                        st.code(query, language="sql")
-                else:
-                    st.warning(resposta)
+                exibir_resultado(query, resposta, df_resultado, "consulta_natural")
         else:
             st.warning("⚠️ Digite uma pergunta primeiro ou clique em uma sugestão")
 
@@ -787,34 +886,61 @@ with tab2:
         limite = st.number_input("Limite máximo:", min_value=10, max_value=1000, value=100, step=10)
         
         validar_sql = st.checkbox("Validar SQL", value=True, help="Verifica se é apenas SELECT")
+        resumir_colunas = st.checkbox(
+            "Colunas principais", value=True,
+            help="Substitui SELECT * FROM docs_para_erp pelas colunas principais"
+        )
     
     if st.button("🚀 Executar SQL", type="primary", width="stretch", key="btn_sql"):
         if consulta_sql:
-            # Limpar SQL: remover ponto-e-vírgula no final e múltiplas statements
-            consulta_sql = consulta_sql.strip()
-            
-            # Remover ponto-e-vírgula no final
-            if consulta_sql.endswith(';'):
-                consulta_sql = consulta_sql[:-1].strip()
+            # Separar statements (ignora ';' final e ';' dentro de literais/comentários)
+            statements = dividir_sql(consulta_sql)
             
             # Verificar se tem múltiplas statements (ponto-e-vírgula no meio)
-            if ';' in consulta_sql:
+            if len(statements) > 1:
                 st.error("❌ Apenas uma consulta SQL por vez é permitida. Remova o ponto-e-vírgula (;) do meio da query.")
                 st.info("💡 **Dica:** Se copiou do exemplo, remova todos os ponto-e-vírgulas (;)")
                 st.stop()
             
+            consulta_sql = statements[0] if statements else ''
+            
             # Validação básica
             if validar_sql:
-                if not consulta_sql.strip().upper().startswith('SELECT'):
+                if tipo_statement(consulta_sql) != 'SELECT':
                     st.error("❌ Apenas consultas SELECT são permitidas por segurança!")
                     st.stop()
             
             # Adicionar LIMIT se não tiver
-            if 'LIMIT' not in consulta_sql.upper():
+            limit_sql = RE_LIMIT.search(consulta_sql)
+            if limit_sql is None:
                 consulta_sql += f" LIMIT {limite}"
             
+            # Projeção explícita em vez de todas as colunas da tabela
+            if resumir_colunas:
+                consulta_projetada = projetar_colunas(consulta_sql, COLUNAS_RESUMO)
+                if consulta_projetada != consulta_sql:
+                    consulta_sql = consulta_projetada
+                    with st.expander("🔎 Query executada", expanded=False):
+                        st.code(consulta_sql, language="sql")
+            
             with st.spinner("⚙️ Executando SQL..."):
-                df_result = executar_query(consulta_sql)
+                tabela = st.empty()
+                
+                if limit_sql is not None and int(limit_sql.group(1)) > LINHAS_POR_BLOCO:
+                    # Resultado potencialmente grande: mostrar o primeiro bloco
+                    # assim que chega e juntar os restantes no fim
+                    blocos = []
+                    try:
+                        for bloco in ler_query_em_blocos(consulta_sql):
+                            if not blocos:
+                                tabela.dataframe(bloco, width="stretch", hide_index=True, height=500)
+                            blocos.append(bloco)
+                        df_result = pd.concat(blocos, ignore_index=True) if blocos else pd.DataFrame()
+                    except Exception as e:
+                        st.error(f"❌ Erro ao executar consulta: {e}")
+                        df_result = pd.DataFrame()
+                else:
+                    df_result = executar_query(consulta_sql)
                 
                 if not df_result.empty:
                     st.success(f"✅ Consulta executada! {len(df_result)} registro(s) encontrado(s)")
@@ -823,9 +949,9 @@ with tab2:
                     valor_cols = [col for col in df_result.columns if 'valor' in col.lower()]
                     for col in valor_cols:
                         if df_result[col].dtype in ['float64', 'int64']:
-                            df_result[f'{col}_fmt'] = df_result[col].apply(format_currency)
+                            df_result[f'{col}_fmt'] = format_currency_series(df_result[col])
                     
-                    st.dataframe(df_result, width="stretch", hide_index=True, height=500)
+                    tabela.dataframe(df_result, width="stretch", hide_index=True, height=500)
                     
                     # Botões de exportação
                     criar_botoes_exportacao(df_result, "sql_result")
@@ -871,10 +997,10 @@ with st.sidebar:
     
     # Estatísticas rápidas
     st.markdown("**📊 Dados Disponíveis:**")
-    query_stats = "SELECT COUNT(*) as total FROM docs_para_erp"
-    df_stats = executar_query(query_stats)
-    if not df_stats.empty:
-        st.write(f"📝 {int(df_stats['total'].iloc[0]):,} documentos".replace(",", "."))
+    try:
+        st.write(f"📝 {contar_documentos(versao_dados()):,} documentos".replace(",", "."))
+    except Exception as e:
+        st.error(f"❌ Erro ao contar documentos: {e}")
 
 # ==================== FOOTER ====================
 
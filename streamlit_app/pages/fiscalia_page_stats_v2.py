@@ -6,8 +6,10 @@ Usa DatabaseManager corretamente (cria BD automaticamente)
 import streamlit as st
 import sys
 from pathlib import Path
+import numpy as np
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
 from datetime import datetime, timedelta
 from sqlalchemy import text
 import warnings
@@ -53,31 +55,129 @@ def get_db():
     return DatabaseManager()
 
 
-def load_stats_data(data_inicio: str, data_fim: str) -> pd.DataFrame:
-    """Carrega dados para estatísticas com filtro de período"""
-    try:
-        db = get_db()
-        session = db.get_session()
-        
-        query = text(f"""
-        SELECT * FROM docs_para_erp 
-        WHERE date(time_stamp) BETWEEN '{data_inicio}' AND '{data_fim}'
-        ORDER BY time_stamp DESC
-        """)
-        
-        df = pd.read_sql_query(query, session.bind)
-        session.close()
-        
-        # Converter datas
-        date_columns = ['time_stamp', 'data_emissao', 'data_saida_entrada']
-        for col in date_columns:
-            if col in df.columns:
-                df[col] = pd.to_datetime(df[col], errors='coerce')
-        
-        return df
-    except Exception as e:
-        st.error(f"❌ Erro ao carregar dados: {e}")
-        return pd.DataFrame()
+def _ler_sql(query: str, params: dict) -> pd.DataFrame:
+    """Executa query SQL e retorna DataFrame (erros são propagados ao chamador)"""
+    # Conexão emprestada do pool da engine e devolvida no fim da leitura
+    return pd.read_sql_query(text(query), get_db().engine, params=params)
+
+
+# Período de análise (data de upload) - intervalo semiaberto sobre a coluna
+# indexada, sem aplicar date() linha a linha
+FILTRO_PERIODO = "time_stamp >= :ts_inicio AND time_stamp < :ts_fim"
+
+
+def _params_periodo(data_inicio: str, data_fim: str) -> dict:
+    """Parâmetros de FILTRO_PERIODO (data_fim inclusiva)"""
+    dia_seguinte = datetime.strptime(data_fim, '%Y-%m-%d') + timedelta(days=1)
+    return {
+        'ts_inicio': f"{data_inicio} 00:00:00",
+        'ts_fim': dia_seguinte.strftime('%Y-%m-%d 00:00:00'),
+    }
+
+
+@st.cache_data(ttl=1, show_spinner=False)
+def versao_dados() -> int:
+    """Versão atual de docs_para_erp (muda a cada upload)"""
+    return get_db().get_versao_dados('docs_para_erp')
+
+
+# Os loaders abaixo recebem `versao` (de versao_dados) apenas para a incluir
+# na chave do cache: após um upload a chave muda e os dados são relidos.
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_stats_data(data_inicio: str, data_fim: str, versao: int = 0) -> pd.DataFrame:
+    """
+    Carrega o valor de cada documento do período
+    Usado só onde é preciso a distribuição completa (mediana, desvio padrão,
+    histograma e faixas); os restantes indicadores são agregados no SQL
+    """
+    return _ler_sql(f"""
+    SELECT valor_total
+    FROM docs_para_erp 
+    WHERE {FILTRO_PERIODO}
+    """, _params_periodo(data_inicio, data_fim))
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_mensal(data_inicio: str, data_fim: str, versao: int = 0) -> pd.DataFrame:
+    """Quantidade de documentos por mês de emissão (AAAA-MM)"""
+    return _ler_sql(f"""
+    SELECT strftime('%Y-%m', data_emissao) as mes_ano, COUNT(*) as "Quantidade"
+    FROM docs_para_erp
+    WHERE {FILTRO_PERIODO} AND strftime('%Y-%m', data_emissao) IS NOT NULL
+    GROUP BY mes_ano
+    ORDER BY mes_ano
+    """, _params_periodo(data_inicio, data_fim))
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_kpis(data_inicio: str, data_fim: str, versao: int = 0) -> pd.DataFrame:
+    """Todos os indicadores escalares do período numa única query (uma linha)"""
+    return _ler_sql(f"""
+    SELECT 
+        COUNT(*) as total_docs,
+        COALESCE(SUM(valor_total), 0) as valor_total,
+        COALESCE(AVG(valor_total), 0) as valor_medio,
+        COALESCE(MIN(valor_total), 0) as valor_minimo,
+        COALESCE(MAX(valor_total), 0) as valor_maximo,
+        COALESCE(SUM(CASE WHEN erp_processado = 'Yes' THEN 1 ELSE 0 END), 0) as processados,
+        COALESCE(SUM(CASE WHEN erp_processado = 'No' THEN 1 ELSE 0 END), 0) as pendentes,
+        COUNT(DISTINCT uf_emitente) as ufs
+    FROM docs_para_erp
+    WHERE {FILTRO_PERIODO}
+    """, _params_periodo(data_inicio, data_fim))
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_por_uf(data_inicio: str, data_fim: str, versao: int = 0) -> pd.DataFrame:
+    """Quantidade e valor total por estado (um só GROUP BY para os dois gráficos)"""
+    return _ler_sql(f"""
+    SELECT 
+        uf_emitente as "UF",
+        COUNT(*) as "Quantidade",
+        SUM(valor_total) as "Valor Total"
+    FROM docs_para_erp
+    WHERE {FILTRO_PERIODO} AND uf_emitente IS NOT NULL
+    GROUP BY uf_emitente
+    """, _params_periodo(data_inicio, data_fim))
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_status_erp(data_inicio: str, data_fim: str, versao: int = 0) -> pd.DataFrame:
+    """Quantidade de documentos por status de processamento ERP"""
+    return _ler_sql(f"""
+    SELECT erp_processado as "Status", COUNT(*) as "Quantidade"
+    FROM docs_para_erp
+    WHERE {FILTRO_PERIODO}
+    GROUP BY erp_processado
+    ORDER BY 2 DESC
+    """, _params_periodo(data_inicio, data_fim))
+
+
+# Colunas permitidas nos rankings (interpoladas no SQL)
+COLUNAS_RANKING = {
+    'razao_social_emitente': 'Emitente',
+    'razao_social_destinatario': 'Destinatário',
+}
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_ranking(coluna: str, data_inicio: str, data_fim: str, versao: int = 0) -> pd.DataFrame:
+    """Top 10 de `coluna` (emitente/destinatário) por valor total"""
+    if coluna not in COLUNAS_RANKING:
+        raise ValueError(f"Coluna de ranking inválida: {coluna}")
+    
+    return _ler_sql(f"""
+    SELECT 
+        {coluna} as "{COLUNAS_RANKING[coluna]}",
+        SUM(valor_total) as "Valor Total (R$)",
+        COUNT(numero_nf) as "Qtd Docs"
+    FROM docs_para_erp
+    WHERE {FILTRO_PERIODO} AND {coluna} IS NOT NULL
+    GROUP BY {coluna}
+    ORDER BY 2 DESC
+    LIMIT 10
+    """, _params_periodo(data_inicio, data_fim))
 
 
 def format_currency(value) -> str:
@@ -129,13 +229,24 @@ st.markdown("---")
 
 # ==================== CARREGAR DADOS ====================
 
+periodo = (str(data_inicio), str(data_fim), versao_dados())
+
 with st.spinner("🔄 Carregando dados..."):
-    df = load_stats_data(str(data_inicio), str(data_fim))
+    try:
+        kpis = load_kpis(*periodo).iloc[0]
+    except Exception as e:
+        st.error(f"❌ Erro ao carregar dados: {e}")
+        st.stop()
+
+total_docs = int(kpis['total_docs'])
 
-if df.empty:
+if total_docs == 0:
     show_info("Nenhum dado encontrado no período selecionado.", "💡 Ajuste as datas ou use a página **📤 Upload**.")
     st.stop()
 
+processados = int(kpis['processados'])
+pendentes = int(kpis['pendentes'])
+
 # ==================== KPIs PRINCIPAIS ====================
 
 st.markdown("### 📊 Indicadores Principais")
@@ -143,113 +254,109 @@ st.markdown("### 📊 Indicadores Principais")
 col1, col2, col3, col4, col5 = st.columns(5)
 
 with col1:
-    total_docs = len(df)
     st.metric("📝 Total Documentos", format_number(total_docs))
 
 with col2:
-    total_valor = df['valor_total'].sum() if 'valor_total' in df.columns else 0
-    st.metric("💰 Valor Total", format_currency(total_valor))
+    st.metric("💰 Valor Total", format_currency(kpis['valor_total']))
 
 with col3:
-    if 'valor_total' in df.columns and total_docs > 0:
-        valor_medio = df['valor_total'].mean()
-        st.metric("📊 Valor Médio", format_currency(valor_medio))
-    else:
-        st.metric("📊 Valor Médio", "R$ 0,00")
+    st.metric("📊 Valor Médio", format_currency(kpis['valor_medio']))
 
 with col4:
-    if 'erp_processado' in df.columns:
-        processados = len(df[df['erp_processado'] == 'Yes'])
-        percentual = (processados / total_docs * 100) if total_docs > 0 else 0
-        st.metric("✅ Processados ERP", f"{processados}", f"{percentual:.1f}%")
-    else:
-        st.metric("✅ Processados ERP", "0")
+    percentual = processados / total_docs * 100
+    st.metric("✅ Processados ERP", f"{processados}", f"{percentual:.1f}%")
 
 with col5:
-    if 'uf_emitente' in df.columns:
-        ufs = df['uf_emitente'].nunique()
-        st.metric("🗺️ Estados", format_number(ufs))
-    else:
-        st.metric("🗺️ Estados", "0")
+    st.metric("🗺️ Estados", format_number(kpis['ufs']))
 
 st.markdown("---")
 
-# ==================== GRÁFICOS - LINHA 1 ====================
+# ==================== SELEÇÃO DE ANÁLISE ====================
+
+# Só a análise escolhida é carregada e desenhada em cada rerun
+analises = ["📈 Análises Visuais", "🏆 Rankings", "💰 Análise Financeira"]
+analise = st.radio(
+    "Escolha a análise:",
+    analises,
+    horizontal=True,
+    label_visibility="collapsed",
+    key="analise_stats"
+)
+
+st.markdown("---")
 
-st.markdown("### 📈 Análises Visuais")
+if analise == "📈 Análises Visuais":
+    # ==================== GRÁFICOS - LINHA 1 ====================
 
-col1, col2 = st.columns(2)
+    st.markdown("### 📈 Análises Visuais")
 
-with col1:
-    st.markdown("#### 🗺️ Documentos por Estado")
+    with st.spinner("🔄 Carregando dados..."):
+        try:
+            df_por_uf = load_por_uf(*periodo)
+            df_temp_grouped = load_mensal(*periodo)
+            df_erp = load_status_erp(*periodo)
+        except Exception as e:
+            st.error(f"❌ Erro ao carregar dados: {e}")
+            st.stop()
     
-    if 'uf_emitente' in df.columns:
-        df_uf = df['uf_emitente'].value_counts().reset_index()
-        df_uf.columns = ['UF', 'Quantidade']
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.markdown("#### 🗺️ Documentos por Estado")
         
-        fig_uf = px.bar(
-            df_uf.head(10),
-            x='UF',
-            y='Quantidade',
-            title='Top 10 Estados',
-            color='Quantidade',
-            color_continuous_scale='Blues'
-        )
-        fig_uf.update_layout(height=400, showlegend=False)
-        st.plotly_chart(fig_uf, width="stretch")
-    else:
-        st.info("📊 Dados de UF não disponíveis")
+        if not df_por_uf.empty:
+            df_uf = df_por_uf.nlargest(10, 'Quantidade')[['UF', 'Quantidade']]
+            
+            fig_uf = px.bar(
+                df_uf,
+                x='UF',
+                y='Quantidade',
+                title='Top 10 Estados',
+                color='Quantidade',
+                color_continuous_scale='Blues'
+            )
+            fig_uf.update_layout(height=400, showlegend=False)
+            st.plotly_chart(fig_uf, width="stretch")
+        else:
+            st.info("📊 Dados de UF não disponíveis")
 
-with col2:
-    st.markdown("#### 💰 Valor Total por Estado")
-    
-    if 'uf_emitente' in df.columns and 'valor_total' in df.columns:
-        df_uf_valor = df.groupby('uf_emitente')['valor_total'].sum().reset_index()
-        df_uf_valor.columns = ['UF', 'Valor Total']
-        df_uf_valor = df_uf_valor.sort_values('Valor Total', ascending=False)
+    with col2:
+        st.markdown("#### 💰 Valor Total por Estado")
         
-        fig_valor = px.bar(
-            df_uf_valor.head(10),
-            x='UF',
-            y='Valor Total',
-            title='Top 10 Estados por Valor',
-            color='Valor Total',
-            color_continuous_scale='Greens'
-        )
-        fig_valor.update_layout(height=400, showlegend=False)
-        st.plotly_chart(fig_valor, width="stretch")
-    else:
-        st.info("📊 Dados de valor não disponíveis")
+        if not df_por_uf.empty:
+            df_uf_valor = df_por_uf.nlargest(10, 'Valor Total')[['UF', 'Valor Total']]
+            
+            fig_valor = px.bar(
+                df_uf_valor,
+                x='UF',
+                y='Valor Total',
+                title='Top 10 Estados por Valor',
+                color='Valor Total',
+                color_continuous_scale='Greens'
+            )
+            fig_valor.update_layout(height=400, showlegend=False)
+            st.plotly_chart(fig_valor, width="stretch")
+        else:
+            st.info("📊 Dados de valor não disponíveis")
 
-# ==================== GRÁFICOS - LINHA 2 ====================
+    # ==================== GRÁFICOS - LINHA 2 ====================
 
-col1, col2 = st.columns(2)
+    col1, col2 = st.columns(2)
 
-with col1:
-    st.markdown("#### 📅 Evolução no Tempo")
-    
-    if 'data_emissao' in df.columns:
-        df_temp = df.copy()
-        # Remover valores nulos e garantir formato datetime
-        df_temp = df_temp[df_temp['data_emissao'].notna()].copy()
+    with col1:
+        st.markdown("#### 📅 Evolução no Tempo")
         
-        if len(df_temp) > 0:
-            # Criar coluna mês/ano formatada
-            df_temp['mes_ano'] = df_temp['data_emissao'].dt.strftime('%Y-%m')
-            df_temp_grouped = df_temp.groupby('mes_ano').size().reset_index(name='Quantidade')
-            
-            # Ordenar por data
-            df_temp_grouped = df_temp_grouped.sort_values('mes_ano')
-            
+        if len(df_temp_grouped) > 0:
             # Converter para formato legível (MMM/AAAA)
-            df_temp_grouped['mes_ano_label'] = pd.to_datetime(df_temp_grouped['mes_ano']).dt.strftime('%b/%Y')
+            df_temp_grouped['mes_ano_label'] = pd.to_datetime(df_temp_grouped['mes_ano'], format='%Y-%m').dt.strftime('%b/%Y')
             
             fig_tempo = px.line(
                 df_temp_grouped,
                 x='mes_ano_label',
                 y='Quantidade',
                 title='Documentos por Mês',
-                markers=True
+                markers=True,
+                render_mode='webgl'
             )
             fig_tempo.update_layout(
                 height=400,
@@ -260,15 +367,10 @@ with col1:
             st.plotly_chart(fig_tempo, width="stretch")
         else:
             st.info("📊 Sem dados com datas válidas")
-    else:
-        st.info("📊 Dados de data não disponíveis")
 
-with col2:
-    st.markdown("#### ⚙️ Status de Processamento ERP")
-    
-    if 'erp_processado' in df.columns:
-        df_erp = df['erp_processado'].value_counts().reset_index()
-        df_erp.columns = ['Status', 'Quantidade']
+    with col2:
+        st.markdown("#### ⚙️ Status de Processamento ERP")
+        
         df_erp['Status'] = df_erp['Status'].map({'Yes': 'Processado', 'No': 'Pendente'})
         
         fig_erp = px.pie(
@@ -281,95 +383,117 @@ with col2:
         )
         fig_erp.update_layout(height=400)
         st.plotly_chart(fig_erp, width="stretch")
-    else:
-        st.info("📊 Dados de status ERP não disponíveis")
-
-st.markdown("---")
 
-# ==================== TABELAS DE TOP ====================
+elif analise == "🏆 Rankings":
+    # ==================== TABELAS DE TOP ====================
 
-st.markdown("### 🏆 Rankings (por Valor Total)")
+    st.markdown("### 🏆 Rankings (por Valor Total)")
 
-col1, col2 = st.columns(2)
-
-with col1:
-    st.markdown("#### 📤 Top 10 Emitentes")
+    with st.spinner("🔄 Carregando dados..."):
+        try:
+            df_emit = load_ranking('razao_social_emitente', *periodo)
+            df_dest = load_ranking('razao_social_destinatario', *periodo)
+        except Exception as e:
+            st.error(f"❌ Erro ao carregar dados: {e}")
+            st.stop()
     
-    if 'razao_social_emitente' in df.columns and 'valor_total' in df.columns:
-        df_emit = df.groupby('razao_social_emitente').agg({
-            'valor_total': 'sum',
-            'numero_nf': 'count'
-        }).reset_index()
-        
-        df_emit.columns = ['Emitente', 'Valor Total (R$)', 'Qtd Docs']
-        df_emit = df_emit.sort_values('Valor Total (R$)', ascending=False).head(10)
-        
-        df_emit['Valor Total'] = df_emit['Valor Total (R$)'].apply(format_currency)
-        df_emit = df_emit[['Emitente', 'Valor Total', 'Qtd Docs']]
-        
-        st.dataframe(df_emit, width="stretch", hide_index=True, height=400)
-    else:
-        st.info("📊 Dados de emitentes não disponíveis")
+    col1, col2 = st.columns(2)
 
-with col2:
-    st.markdown("#### 📥 Top 10 Destinatários")
-    
-    if 'razao_social_destinatario' in df.columns and 'valor_total' in df.columns:
-        df_dest = df.groupby('razao_social_destinatario').agg({
-            'valor_total': 'sum',
-            'numero_nf': 'count'
-        }).reset_index()
-        
-        df_dest.columns = ['Destinatário', 'Valor Total (R$)', 'Qtd Docs']
-        df_dest = df_dest.sort_values('Valor Total (R$)', ascending=False).head(10)
-        
-        df_dest['Valor Total'] = df_dest['Valor Total (R$)'].apply(format_currency)
-        df_dest = df_dest[['Destinatário', 'Valor Total', 'Qtd Docs']]
+    with col1:
+        st.markdown("#### 📤 Top 10 Emitentes")
         
-        st.dataframe(df_dest, width="stretch", hide_index=True, height=400)
-    else:
-        st.info("📊 Dados de destinatários não disponíveis")
+        if not df_emit.empty:
+            # Coluna continua numérica (ordenável); só as células visíveis são formatadas
+            st.dataframe(
+                df_emit.style.format({'Valor Total (R$)': format_currency}),
+                width="stretch",
+                hide_index=True,
+                height=400
+            )
+        else:
+            st.info("📊 Dados de emitentes não disponíveis")
 
-st.markdown("---")
+    with col2:
+        st.markdown("#### 📥 Top 10 Destinatários")
+        
+        if not df_dest.empty:
+            # Coluna continua numérica (ordenável); só as células visíveis são formatadas
+            st.dataframe(
+                df_dest.style.format({'Valor Total (R$)': format_currency}),
+                width="stretch",
+                hide_index=True,
+                height=400
+            )
+        else:
+            st.info("📊 Dados de destinatários não disponíveis")
 
-# ==================== ANÁLISE DE VALORES ====================
+else:  # "💰 Análise Financeira"
+    # ==================== ANÁLISE DE VALORES ====================
 
-if 'valor_total' in df.columns:
     st.markdown("### 💰 Análise Financeira")
+
+    with st.spinner("🔄 Carregando dados..."):
+        try:
+            df = load_stats_data(*periodo)
+        except Exception as e:
+            st.error(f"❌ Erro ao carregar dados: {e}")
+            st.stop()
     
+    # Estatísticas, histograma e faixas calculados sobre o mesmo array NumPy
+    valores = df['valor_total'].dropna().to_numpy(dtype=np.float64)
+
+    if valores.size > 0:
+        contagens, limites = np.histogram(valores, bins=30)
+        stats_valores = {
+            'min': valores.min(),
+            'max': valores.max(),
+            'mediana': np.median(valores),
+            'std': valores.std(ddof=1) if valores.size > 1 else 0.0,
+        }
+    else:
+        contagens, limites = np.zeros(30, dtype=np.int64), np.linspace(0, 1, 31)
+        stats_valores = {'min': 0.0, 'max': 0.0, 'mediana': 0.0, 'std': 0.0}
+
+    # Faixas: índice de cada valor por pesquisa binária nos limites superiores.
+    # Intervalos fechados à direita e sem o zero, como pd.cut(bins=[0, 1000, ...]):
+    # (0, 1k], (1k, 5k], (5k, 10k], (10k, 50k], (50k, inf) - side='left' põe 1000 em '0-1k'
+    faixas_limites = np.array([1000, 5000, 10000, 50000])
+    faixas_labels = ['0-1k', '1k-5k', '5k-10k', '10k-50k', '50k+']
+    faixas_idx = np.searchsorted(faixas_limites, valores[valores > 0], side='left')
+    faixas_contagem = np.bincount(faixas_idx, minlength=len(faixas_labels))
+
     col1, col2, col3 = st.columns(3)
-    
+
     with col1:
         st.markdown("#### 📊 Distribuição de Valores")
         
-        fig_hist = px.histogram(
-            df,
-            x='valor_total',
-            nbins=30,
-            title='Distribuição de Valores'
+        fig_hist = go.Figure(go.Bar(
+            x=(limites[:-1] + limites[1:]) / 2,
+            y=contagens,
+            width=np.diff(limites),
+            name='valor_total'
+        ))
+        fig_hist.update_layout(
+            height=300,
+            title='Distribuição de Valores',
+            xaxis_title='valor_total',
+            yaxis_title='count',
+            bargap=0
         )
-        fig_hist.update_layout(height=300)
         st.plotly_chart(fig_hist, width="stretch")
-    
+
     with col2:
         st.markdown("#### 📈 Estatísticas")
         
-        stats_valores = df['valor_total'].describe()
-        
         st.metric("Mínimo", format_currency(stats_valores['min']))
         st.metric("Máximo", format_currency(stats_valores['max']))
-        st.metric("Mediana", format_currency(stats_valores['50%']))
+        st.metric("Mediana", format_currency(stats_valores['mediana']))
         st.metric("Desvio Padrão", format_currency(stats_valores['std']))
-    
+
     with col3:
         st.markdown("#### 🎯 Faixas de Valor")
         
-        bins = [0, 1000, 5000, 10000, 50000, float('inf')]
-        labels = ['0-1k', '1k-5k', '5k-10k', '10k-50k', '50k+']
-        df['faixa_valor'] = pd.cut(df['valor_total'], bins=bins, labels=labels)
-        
-        df_faixas = df['faixa_valor'].value_counts().reset_index()
-        df_faixas.columns = ['Faixa', 'Quantidade']
+        df_faixas = pd.DataFrame({'Faixa': faixas_labels, 'Quantidade': faixas_contagem})
         
         fig_faixas = px.bar(
             df_faixas,
@@ -391,24 +515,22 @@ with st.sidebar:
     st.markdown("---")
     
     st.markdown("**Documentos:**")
-    st.write(f"📝 Total: {format_number(len(df))}")
-    
-    if 'erp_processado' in df.columns:
-        proc = len(df[df['erp_processado'] == 'Yes'])
-        pend = len(df[df['erp_processado'] == 'No'])
-        st.write(f"✅ Processados: {format_number(proc)}")
-        st.write(f"⏳ Pendentes: {format_number(pend)}")
+    st.write(f"📝 Total: {format_number(total_docs)}")
+    st.write(f"✅ Processados: {format_number(processados)}")
+    st.write(f"⏳ Pendentes: {format_number(pendentes)}")
     
     st.markdown("---")
     
-    if 'valor_total' in df.columns:
-        st.markdown("**Valores:**")
-        st.write(f"💰 Total: {format_currency(df['valor_total'].sum())}")
-        st.write(f"📊 Médio: {format_currency(df['valor_total'].mean())}")
+    st.markdown("**Valores:**")
+    st.write(f"💰 Total: {format_currency(kpis['valor_total'])}")
+    st.write(f"📊 Médio: {format_currency(kpis['valor_medio'])}")
     
     st.markdown("---")
     
     if st.button("🔄 Atualizar Dados", width="stretch"):
+        for loader in (load_kpis, load_por_uf, load_status_erp,
+                       load_ranking, load_mensal, load_stats_data):
+            loader.clear()
         st.rerun()
 
 # ==================== FOOTER ====================
@@ -7,8 +7,10 @@ import streamlit as st
 import sys
 from pathlib import Path
 from datetime import datetime
+import re
 import zipfile
-import io
+from collections import Counter
+from lxml import etree
 
 # Adicionar src ao path de forma robusta
 current_file = Path(__file__).resolve()
@@ -38,122 +40,206 @@ show_header("Upload de Notas Fiscais", "Carregar arquivos XML (individual ou ZIP
 
 # ==================== FUNÇÕES AUXILIARES ====================
 
+# Parser partilhado: sem DTD, entidades externas, rede nem índice de IDs
+XML_PARSER = etree.XMLParser(
+    resolve_entities=False,
+    load_dtd=False,
+    no_network=True,
+    huge_tree=False,
+    collect_ids=False,
+    recover=False
+)
+
+# Atributo Id="NFe<44 dígitos>" da própria tag infNFe (com ou sem prefixo);
+# \b evita atributos terminados em Id (refId, xId...)
+RE_CHAVE_ID = re.compile(rb'<(?:\w+:)?infNFe\b[^>]*?\bId=["\']NFe(\d{44})["\']')
+
+# Entradas do ZIP por lote: cada entrada é descomprimida uma só vez e só
+# o conteúdo de um lote fica em memória (uma consulta de duplicados por lote)
+LOTE_ZIP = 10
+
 @st.cache_resource
 def get_db():
     """Retorna instância do DatabaseManager (cria BD automaticamente)"""
     return DatabaseManager()
 
 
-def registrar_resultado_bd(arquivo_nome: str, resultado: str, causa: str = None):
+def get_processor():
     """
-    Registra resultado na tabela registo_resultados usando DatabaseManager
+    NFeProcessor da sessão (criado uma vez, reutilizado entre reruns)
+    Não usa cache_resource: o processador guarda o XML em curso e não
+    pode ser partilhado entre sessões em simultâneo
     """
+    if 'nfe_processor' not in st.session_state:
+        st.session_state.nfe_processor = NFeProcessor()
+    return st.session_state.nfe_processor
+
+
+def resultado_bd(arquivo_nome: str, resultado: str, causa: str = None) -> dict:
+    """Dados de uma linha de registo_resultados (gravadas em lote em registrar_resultados_bd)"""
+    return {
+        'time_stamp': datetime.now(),
+        'path_nome_arquivo': str(Path("upload") / arquivo_nome),
+        'resultado': resultado,
+        'causa': causa
+    }
+
+
+def registrar_resultados_bd(resultados_data: list):
+    """
+    Registra resultados na tabela registo_resultados numa única transação
+    """
+    if not resultados_data:
+        return
+    
     try:
         db = get_db()
-        
-        resultado_data = {
-            'time_stamp': datetime.now(),
-            'path_nome_arquivo': str(Path("upload") / arquivo_nome),
-            'resultado': resultado,
-            'causa': causa
-        }
-        
-        db.add_resultado(resultado_data)
+        db.add_resultados_bulk(resultados_data)
         
     except Exception as e:
-        st.warning(f"⚠️ Erro ao registrar resultado: {e}")
+        st.warning(f"⚠️ Erro ao registrar resultados: {e}")
+
+
+def verificar_conteudo(content: bytes) -> str:
+    """
+    Rejeições baratas, antes de qualquer regex ou parse
+    Retorna: mensagem de erro, ou None se o conteúdo pode ser um XML
+    """
+    if len(content) < 100:
+        return 'XML muito pequeno (possivelmente corrompido)'
+    
+    if b'\x00' in content[:1024]:
+        return 'Conteúdo binário (não é um XML de texto)'
+    
+    return None
 
 
 def validate_xml_structure(content: bytes) -> tuple:
     """
-    Valida estrutura XML
+    Valida estrutura XML (lxml, a partir dos bytes - sem decode prévio)
     Retorna: (is_valid: bool, message: str, root: Element or None)
     """
+    erro = verificar_conteudo(content)
+    if erro:
+        return (False, erro, None)
+    
     try:
-        import xml.etree.ElementTree as ET
-        
-        xml_str = content.decode('utf-8', errors='ignore')
-        root = ET.fromstring(xml_str)
-        
-        if len(xml_str) < 100:
-            return (False, 'XML muito pequeno (possivelmente corrompido)', None)
+        root = etree.fromstring(content, parser=XML_PARSER)
         
         if not root.tag:
             return (False, 'XML sem tag raiz', None)
         
         return (True, 'XML válido', root)
         
-    except ET.ParseError as e:
+    except etree.XMLSyntaxError as e:
         return (False, f'XML mal formado: {str(e)}', None)
-    except UnicodeDecodeError:
-        return (False, 'Encoding inválido (não é UTF-8)', None)
     except Exception as e:
         return (False, f'Erro ao validar XML: {str(e)}', None)
 
 
+def extract_chave_from_bytes(content: bytes) -> str:
+    """
+    Extrai chave de acesso do atributo Id="NFe..." diretamente dos bytes
+    Caminho rápido sem construir a árvore; None se não encontrar
+    """
+    match = RE_CHAVE_ID.search(content)
+    return match.group(1).decode('ascii') if match else None
+
+
 def extract_chave_acesso_from_root(root) -> str:
     """Extrai chave de acesso de um elemento XML já parseado"""
     try:
-        for elem in root.iter():
-            if 'chNFe' in elem.tag or 'chave' in elem.tag.lower():
-                if elem.text and len(elem.text) == 44:
-                    return elem.text
+        for elem in root.iterfind('.//{*}chNFe'):
+            if elem.text and len(elem.text) == 44:
+                return elem.text
         
-        for elem in root.iter():
-            if 'Id' in elem.attrib:
-                id_val = elem.attrib['Id']
-                if 'NFe' in id_val:
-                    chave = id_val.replace('NFe', '')
-                    if len(chave) == 44 and chave.isdigit():
-                        return chave
+        for elem in root.iterfind('.//{*}infNFe[@Id]'):
+            chave = elem.get('Id').replace('NFe', '')
+            if len(chave) == 44 and chave.isdigit():
+                return chave
         
         return None
     except:
         return None
 
 
-def check_duplicate_by_chave(chave_acesso: str) -> tuple:
+def obter_chave(content: bytes) -> tuple:
+    """
+    Extrai chave de acesso (regex sobre os bytes; parse XML só se falhar)
+    Com a regex o XML não é validado: quem grava o ficheiro valida-o antes
+    (validado=False); sem a regex o parse já o validou (validado=True)
+    Retorna: (chave: str or None, erro: str or None, validado: bool)
+    """
+    erro = verificar_conteudo(content)
+    if erro:
+        return (None, erro, False)
+    
+    chave = extract_chave_from_bytes(content)
+    if chave:
+        return (chave, None, False)
+    
+    is_valid, validation_msg, root = validate_xml_structure(content)
+    if not is_valid:
+        return (None, validation_msg, False)
+    
+    chave = extract_chave_acesso_from_root(root)
+    if not chave:
+        return (None, 'Chave de acesso NFe não encontrada', True)
+    
+    return (chave, None, True)
+
+
+def check_duplicates_by_chaves(chaves: list) -> dict:
     """
-    Verifica se chave já existe na BD usando DatabaseManager
-    Retorna: (is_duplicate: bool, existing_file: str)
+    Verifica numa só consulta quais chaves já existem na BD
+    Retorna: {chave: existing_file} apenas para as chaves duplicadas
     """
-    if not chave_acesso:
-        return (False, None)
+    if not chaves:
+        return {}
     
     try:
         db = get_db()
-        doc = db.get_documento_by_chave(chave_acesso)
+        existentes = db.get_documentos_by_chaves(chaves)
         
-        if doc:
-            existing_file = Path(doc.path_nome_arquivo).name if doc.path_nome_arquivo else "desconhecido"
-            return (True, existing_file)
-        return (False, None)
+        return {
+            chave: Path(path).name if path else "desconhecido"
+            for chave, path in existentes.items()
+        }
     except Exception as e:
-        st.warning(f"⚠️ Erro ao verificar duplicado: {e}")
-        return (False, None)
+        st.warning(f"⚠️ Erro ao verificar duplicados: {e}")
+        return {}
 
 
-def extract_xml_from_zip(zip_file) -> list:
-    """Extrai XMLs de um ZIP - retorna [(filename, content)]"""
-    xml_files = []
-    
+def list_xml_in_zip(zip_file) -> list:
+    """Lista XMLs de um ZIP pelo diretório central, sem descomprimir - retorna [ZipInfo]"""
     try:
-        with zipfile.ZipFile(io.BytesIO(zip_file.read())) as z:
-            for filename in z.namelist():
-                if filename.startswith('__MACOSX') or filename.startswith('.'):
-                    continue
-                if filename.lower().endswith('.xml'):
-                    content = z.read(filename)
-                    xml_files.append((filename, content))
-        return xml_files
+        with zipfile.ZipFile(zip_file) as z:
+            return [
+                info for info in z.infolist()
+                if not info.filename.startswith(('__MACOSX', '.'))
+                and info.filename.lower().endswith('.xml')
+            ]
     except zipfile.BadZipFile:
         st.error("❌ Ficheiro ZIP inválido ou corrompido")
         return []
     except Exception as e:
-        st.error(f"❌ Erro ao extrair ZIP: {e}")
+        st.error(f"❌ Erro ao ler ZIP: {e}")
         return []
 
 
+def iter_xml_from_zip(zip_file, entradas: list):
+    """
+    Lê XMLs do ZIP um de cada vez - gera (filename, content)
+    content é None se a entrada não puder ser extraída
+    """
+    with zipfile.ZipFile(zip_file) as z:
+        for info in entradas:
+            try:
+                yield info.filename, z.read(info)
+            except Exception:
+                yield info.filename, None
+
+
 # ==================== INFO SOBRE TIPOS SUPORTADOS ====================
 
 with st.expander("ℹ️ Tipos de Documentos Suportados"):
@@ -212,97 +298,98 @@ with tab1:
             progress_bar = st.progress(0)
             status_text = st.empty()
             
-            processor = NFeProcessor()
+            processor = get_processor()
             resultados = []
+            pendentes = []
             
-            for idx, file in enumerate(uploaded_files):
-                status_text.text(f"Processando {idx+1}/{len(uploaded_files)}: {file.name}")
-                
-                content = file.read()
-                
-                # 1. Validar XML
-                is_valid, validation_msg, root = validate_xml_structure(content)
-                
-                if not is_valid:
-                    registrar_resultado_bd(file.name, 'ERRO', validation_msg)
-                    
-                    resultados.append({
-                        'arquivo': file.name,
-                        'status': 'erro',
-                        'message': f'❌ {validation_msg}',
-                        'chave': None
-                    })
-                    file.seek(0)
-                    continue
-                
-                # 2. Extrair chave
-                chave = extract_chave_acesso_from_root(root)
-                
-                if not chave:
-                    registrar_resultado_bd(file.name, 'ERRO', 'Chave de acesso NFe não encontrada')
+            # 1. Extrair chaves de todos os ficheiros
+            ficheiros = []
+            for file in uploaded_files:
+                content = file.getvalue()
+                chave, erro, validado = obter_chave(content)
+                ficheiros.append((file, content, chave, erro, validado))
+            
+            # 2. Verificar duplicados (uma única consulta à BD)
+            existentes = check_duplicates_by_chaves([chave for _, _, chave, _, _ in ficheiros if chave])
+            
+            try:
+                for idx, (file, content, chave, erro, validado) in enumerate(ficheiros):
+                    status_text.text(f"Processando {idx+1}/{len(uploaded_files)}: {file.name}")
                     
-                    resultados.append({
-                        'arquivo': file.name,
-                        'status': 'erro',
-                        'message': '❌ Chave de acesso NFe não encontrada',
-                        'chave': None
-                    })
-                    file.seek(0)
-                    continue
-                
-                # 3. Verificar duplicado
-                is_dup, existing_file = check_duplicate_by_chave(chave)
-                
-                if is_dup:
-                    registrar_resultado_bd(
-                        file.name, 
-                        'ERRO', 
-                        f'Duplicado - Chave já processada em: {existing_file}'
-                    )
+                    # Chave nova vinda da regex (sem parse): validar o XML antes de o
+                    # gravar; duplicados e XMLs já validados não voltam a ser lidos
+                    if not erro and not validado and chave not in existentes:
+                        is_valid, validation_msg, _ = validate_xml_structure(content)
+                        if not is_valid:
+                            erro = validation_msg
                     
-                    resultados.append({
-                        'arquivo': file.name,
-                        'status': 'duplicado',
-                        'message': f'Chave já processada no ficheiro: {existing_file}',
-                        'chave': chave
-                    })
-                    file.seek(0)
-                    continue
-                
-                # 4. Processar
-                try:
-                    file.seek(0)
-                    resultado = processor.process_uploaded_file(file, file.name)
+                    if erro:
+                        pendentes.append(resultado_bd(file.name, 'ERRO', erro))
+                        
+                        resultados.append({
+                            'arquivo': file.name,
+                            'status': 'erro',
+                            'message': f'❌ {erro}',
+                            'chave': None
+                        })
+                        continue
                     
-                    if resultado.get('success'):
+                    # 3. Duplicado?
+                    if chave in existentes:
+                        existing_file = existentes[chave]
+                        pendentes.append(resultado_bd(
+                            file.name, 
+                            'ERRO', 
+                            f'Duplicado - Chave já processada em: {existing_file}'
+                        ))
+                        
                         resultados.append({
                             'arquivo': file.name,
-                            'status': 'sucesso',
-                            'message': 'Processado com sucesso',
+                            'status': 'duplicado',
+                            'message': f'Chave já processada no ficheiro: {existing_file}',
                             'chave': chave
                         })
-                    else:
-                        msg_erro = resultado.get('message', 'Erro desconhecido')
-                        registrar_resultado_bd(file.name, 'ERRO', msg_erro)
+                        continue
+                    
+                    # 4. Processar
+                    try:
+                        resultado = processor.process_uploaded_bytes(
+                            content, file.name, duplicado_verificado=True, resultados_pendentes=pendentes
+                        )
+                        
+                        if resultado.get('success'):
+                            # Repetições da mesma chave no lote passam a duplicado
+                            existentes[chave] = file.name
+                            resultados.append({
+                                'arquivo': file.name,
+                                'status': 'sucesso',
+                                'message': 'Processado com sucesso',
+                                'chave': chave
+                            })
+                        else:
+                            msg_erro = resultado.get('message', 'Erro desconhecido')
+                            pendentes.append(resultado_bd(file.name, 'ERRO', msg_erro))
+                            
+                            resultados.append({
+                                'arquivo': file.name,
+                                'status': 'erro',
+                                'message': msg_erro,
+                                'chave': chave
+                            })
+                    except Exception as e:
+                        pendentes.append(resultado_bd(file.name, 'ERRO', str(e)))
                         
                         resultados.append({
                             'arquivo': file.name,
                             'status': 'erro',
-                            'message': msg_erro,
+                            'message': str(e),
                             'chave': chave
                         })
-                except Exception as e:
-                    registrar_resultado_bd(file.name, 'ERRO', str(e))
                     
-                    resultados.append({
-                        'arquivo': file.name,
-                        'status': 'erro',
-                        'message': str(e),
-                        'chave': chave
-                    })
-                
-                file.seek(0)
-                progress_bar.progress((idx + 1) / len(uploaded_files))
+                    progress_bar.progress((idx + 1) / len(uploaded_files))
+            finally:
+                # Também se o lote for interrompido (rerun/stop): o que já foi processado fica registado
+                registrar_resultados_bd(pendentes)
             
             progress_bar.empty()
             status_text.empty()
@@ -312,9 +399,10 @@ with tab1:
             st.subheader("📊 Resultados")
             
             total = len(resultados)
-            sucessos = sum(1 for r in resultados if r['status'] == 'sucesso')
-            duplicados = sum(1 for r in resultados if r['status'] == 'duplicado')
-            erros = sum(1 for r in resultados if r['status'] == 'erro')
+            contagem = Counter(r['status'] for r in resultados)
+            sucessos = contagem['sucesso']
+            duplicados = contagem['duplicado']
+            erros = contagem['erro']
             
             col1, col2, col3, col4 = st.columns(4)
             col1.metric("Total", total)
@@ -359,14 +447,14 @@ with tab2:
     )
     
     if zip_file:
-        xml_files = extract_xml_from_zip(zip_file)
+        xml_files = list_xml_in_zip(zip_file)
         
         if xml_files:
             st.success(f"✅ ZIP com **{len(xml_files)} ficheiro(s) XML**")
             
             with st.expander("📋 Conteúdo"):
-                for i, (filename, content) in enumerate(xml_files, 1):
-                    st.write(f"{i}. {filename} ({len(content)/1024:.1f} KB)")
+                for i, info in enumerate(xml_files, 1):
+                    st.write(f"{i}. {info.filename} ({info.file_size/1024:.1f} KB)")
             
             col1, col2 = st.columns([3, 1])
             
@@ -383,114 +471,98 @@ with tab2:
                     progress_bar = st.progress(0)
                     status_text = st.empty()
                     
-                    processor = NFeProcessor()
+                    processor = get_processor()
                     resultados = []
+                    pendentes = []
                     
-                    for idx, (filename, content) in enumerate(xml_files):
-                        status_text.text(f"Processando {idx+1}/{len(xml_files)}: {filename}")
-                        
-                        # Processar igual ao tab1
-                        is_valid, validation_msg, root = validate_xml_structure(content)
-                        
-                        if not is_valid:
-                            registrar_resultado_bd(filename, 'ERRO', validation_msg)
-                            resultados.append({
-                                'arquivo': filename,
-                                'status': 'erro',
-                                'message': f'❌ {validation_msg}',
-                                'chave': None
-                            })
-                            continue
-                        
-                        chave = extract_chave_acesso_from_root(root)
-                        
-                        if not chave:
-                            registrar_resultado_bd(filename, 'ERRO', 'Chave não encontrada')
-                            resultados.append({
-                                'arquivo': filename,
-                                'status': 'erro',
-                                'message': '❌ Chave não encontrada',
-                                'chave': None
-                            })
-                            continue
-                        
-                        is_dup, existing_file = check_duplicate_by_chave(chave)
-                        
-                        if is_dup:
-                            registrar_resultado_bd(
-                                filename,
-                                'ERRO',
-                                f'Duplicado - já processado em: {existing_file}'
-                            )
-                            resultados.append({
-                                'arquivo': filename,
-                                'status': 'duplicado',
-                                'message': f'Já processado em: {existing_file}',
-                                'chave': chave
-                            })
-                            continue
-                        
-                        try:
-                            class FakeFile:
-                                def __init__(self, name, content):
-                                    self.name = name
-                                    self._content = content
-                                    self._pos = 0
-                                def read(self, size=-1):
-                                    if size == -1:
-                                        result = self._content[self._pos:]
-                                        self._pos = len(self._content)
-                                    else:
-                                        result = self._content[self._pos:self._pos + size]
-                                        self._pos += size
-                                    return result
-                                def seek(self, pos, whence=0):
-                                    if whence == 0:
-                                        self._pos = pos
-                                    elif whence == 1:
-                                        self._pos += pos
-                                    elif whence == 2:
-                                        self._pos = len(self._content) + pos
-                                    return self._pos
-                                def tell(self):
-                                    return self._pos
-                                def getvalue(self):
-                                    return self._content
-                                def getbuffer(self):
-                                    return memoryview(self._content)
-                                @property
-                                def size(self):
-                                    return len(self._content)
-                            
-                            fake_file = FakeFile(filename, content)
-                            resultado = processor.process_uploaded_file(fake_file, filename)
+                    # Processar igual ao tab1 (chaves primeiro, depois uma consulta à
+                    # BD), mas em lotes de LOTE_ZIP entradas lidas uma só vez do ZIP
+                    existentes = {}
+                    
+                    try:
+                        for inicio in range(0, len(xml_files), LOTE_ZIP):
+                            lote = [
+                                (filename, content) + (
+                                    obter_chave(content) if content is not None
+                                    else (None, 'Erro ao extrair do ZIP', False)
+                                )
+                                for filename, content in iter_xml_from_zip(
+                                    zip_file, xml_files[inicio:inicio + LOTE_ZIP]
+                                )
+                            ]
+                            existentes.update(check_duplicates_by_chaves(
+                                [chave for _, _, chave, _, _ in lote if chave and chave not in existentes]
+                            ))
                             
-                            if resultado.get('success'):
-                                resultados.append({
-                                    'arquivo': filename,
-                                    'status': 'sucesso',
-                                    'message': 'Processado',
-                                    'chave': chave
-                                })
-                            else:
-                                msg_erro = resultado.get('message', 'Erro')
-                                registrar_resultado_bd(filename, 'ERRO', msg_erro)
-                                resultados.append({
-                                    'arquivo': filename,
-                                    'status': 'erro',
-                                    'message': msg_erro,
-                                    'chave': chave
-                                })
-                        except Exception as e:
-                            registrar_resultado_bd(filename, 'ERRO', str(e))
-                            resultados.append({
-                                'arquivo': filename,
-                                'status': 'erro',
-                                'message': str(e),
-                                'chave': chave
-                            })
-                        
-                        progress_bar.progress((idx + 1) / len(xml_files))
+                            for idx, (filename, content, chave, erro, validado) in enumerate(lote, start=inicio):
+                                status_text.text(f"Processando {idx+1}/{len(xml_files)}: {filename}")
+                                
+                                # Chave nova: validar o XML antes de o gravar (ver tab1)
+                                if not erro and not validado and chave not in existentes:
+                                    is_valid, validation_msg, _ = validate_xml_structure(content)
+                                    if not is_valid:
+                                        erro = validation_msg
+                                
+                                if erro:
+                                    pendentes.append(resultado_bd(filename, 'ERRO', erro))
+                                    resultados.append({
+                                        'arquivo': filename,
+                                        'status': 'erro',
+                                        'message': f'❌ {erro}',
+                                        'chave': None
+                                    })
+                                    continue
+                                
+                                if chave in existentes:
+                                    existing_file = existentes[chave]
+                                    pendentes.append(resultado_bd(
+                                        filename,
+                                        'ERRO',
+                                        f'Duplicado - já processado em: {existing_file}'
+                                    ))
+                                    resultados.append({
+                                        'arquivo': filename,
+                                        'status': 'duplicado',
+                                        'message': f'Já processado em: {existing_file}',
+                                        'chave': chave
+                                    })
+                                    continue
+                                
+                                try:
+                                    resultado = processor.process_uploaded_bytes(
+                                        content, filename, duplicado_verificado=True, resultados_pendentes=pendentes
+                                    )
+                                    
+                                    if resultado.get('success'):
+                                        existentes[chave] = filename
+                                        resultados.append({
+                                            'arquivo': filename,
+                                            'status': 'sucesso',
+                                            'message': 'Processado',
+                                            'chave': chave
+                                        })
+                                    else:
+                                        msg_erro = resultado.get('message', 'Erro')
+                                        pendentes.append(resultado_bd(filename, 'ERRO', msg_erro))
+                                        resultados.append({
+                                            'arquivo': filename,
+                                            'status': 'erro',
+                                            'message': msg_erro,
+                                            'chave': chave
+                                        })
+                                except Exception as e:
+                                    pendentes.append(resultado_bd(filename, 'ERRO', str(e)))
+                                    resultados.append({
+                                        'arquivo': filename,
+                                        'status': 'erro',
+                                        'message': str(e),
+                                        'chave': chave
+                                    })
+                                
+                                progress_bar.progress((idx + 1) / len(xml_files))
+                    finally:
+                        # Também se o lote for interrompido (ver tab1)
+                        registrar_resultados_bd(pendentes)
                     
                     progress_bar.empty()
                     status_text.empty()
@@ -500,9 +572,10 @@ with tab2:
                     st.subheader("📊 Resultados")
                     
                     total = len(resultados)
-                    sucessos = sum(1 for r in resultados if r['status'] == 'sucesso')
-                    duplicados = sum(1 for r in resultados if r['status'] == 'duplicado')
-                    erros = sum(1 for r in resultados if r['status'] == 'erro')
+                    contagem = Counter(r['status'] for r in resultados)
+                    sucessos = contagem['sucesso']
+                    duplicados = contagem['duplicado']
+                    erros = contagem['erro']
                     
                     col1, col2, col3, col4 = st.columns(4)
                     col1.metric("Total", total)
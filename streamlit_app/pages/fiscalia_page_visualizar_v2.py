@@ -29,6 +29,12 @@ except ImportError as e:
     st.error(f"❌ Erro ao importar módulos: {e}")
     st.stop()
 
+# XlsxWriter é opcional: sem ele, o XLSX é gerado com openpyxl (modo write_only)
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
 # Configuração
 st.set_page_config(
     page_title="Visualizar BD - Fiscalia",
@@ -47,65 +53,230 @@ def get_db():
     return DatabaseManager()
 
 
-def load_docs_para_erp(data_inicio: str, data_fim: str) -> pd.DataFrame:
-    """Carrega dados da tabela docs_para_erp com filtro de período"""
+@st.cache_data(ttl=1, show_spinner=False)
+def versao_dados(tabela: str) -> int:
+    """Versão atual dos dados de `tabela` (muda a cada escrita)"""
+    return get_db().get_versao_dados(tabela)
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _ler_sql(query: str, params: dict, versao: int = 0, **kwargs) -> pd.DataFrame:
+    """
+    Executa query SQL e retorna DataFrame (erros são propagados ao chamador)
+    Cache de 5 minutos chaveado por (query, params, versao): `versao` (de
+    versao_dados) faz uma nova escrita na tabela invalidar os resultados
+    kwargs extra (parse_dates, dtype) seguem para pd.read_sql_query
+    """
+    # Conexão emprestada do pool da engine e devolvida no fim da leitura
+    with get_db().engine.connect() as conn:
+        return pd.read_sql_query(text(query), conn, params=params, **kwargs)
+
+
+# Período (data de upload) - intervalo semiaberto sobre a coluna indexada,
+# sem aplicar date() linha a linha
+FILTRO_PERIODO = "time_stamp >= :ts_inicio AND time_stamp < :ts_fim"
+
+
+def _params_periodo(data_inicio: str, data_fim: str) -> dict:
+    """Parâmetros de FILTRO_PERIODO (data_fim inclusiva)"""
+    dia_seguinte = datetime.strptime(data_fim, '%Y-%m-%d') + timedelta(days=1)
+    return {
+        'ts_inicio': f"{data_inicio} 00:00:00",
+        'ts_fim': dia_seguinte.strftime('%Y-%m-%d 00:00:00'),
+    }
+
+
+# Conversão das colunas de data durante a leitura: o SQLite guarda-as em ISO 8601
+# ("AAAA-MM-DD HH:MM:SS[.ffffff]"), o que permite o parser rápido do pandas
+# em vez da inferência de formato linha a linha
+PARSE_DATA_ISO = {'format': 'ISO8601', 'errors': 'coerce'}
+
+
+# Colunas mostradas na tabela de docs_para_erp (a exportação leva todas)
+COLUNAS_EXIBICAO_DOCS = [
+    'numero_nf', 'chave_acesso', 'razao_social_emitente', 
+    'razao_social_destinatario', 'valor_total', 'data_emissao',
+    'uf_emitente', 'erp_processado', 'time_stamp'
+]
+
+# Colunas lidas de registo_resultados (indicadores, tabela e exportação; sem o id)
+COLUNAS_REGISTO = ['time_stamp', 'path_nome_arquivo', 'resultado', 'causa']
+
+# Colunas com lista de opções nos filtros adicionais
+COLUNAS_FILTRO_DOCS = ('razao_social_emitente', 'razao_social_destinatario')
+
+# Linhas por página das tabelas (só a página atual é enviada ao browser)
+LINHAS_POR_PAGINA = 100
+
+
+def _where_docs(data_inicio: str, data_fim: str, emitente: str = 'Todos',
+                destinatario: str = 'Todos', status_erp: str = 'Todos') -> tuple:
+    """WHERE de docs_para_erp (período + filtros adicionais) - retorna (sql, params)"""
+    condicoes = [FILTRO_PERIODO]
+    params = _params_periodo(data_inicio, data_fim)
+    
+    if emitente != 'Todos':
+        condicoes.append("razao_social_emitente = :emitente")
+        params['emitente'] = emitente
+    if destinatario != 'Todos':
+        condicoes.append("razao_social_destinatario = :destinatario")
+        params['destinatario'] = destinatario
+    if status_erp != 'Todos':
+        condicoes.append("erp_processado = :status_erp")
+        params['status_erp'] = status_erp
+    
+    return " AND ".join(condicoes), params
+
+
+def load_docs_para_erp(data_inicio: str, data_fim: str, emitente: str = 'Todos',
+                       destinatario: str = 'Todos', status_erp: str = 'Todos',
+                       colunas: list = None, limite: int = None,
+                       offset: int = 0) -> pd.DataFrame:
+    """
+    Carrega dados da tabela docs_para_erp com filtro de período e filtros adicionais
+    colunas=None lê todas as colunas; limite=None lê todas as linhas
+    offset salta as primeiras linhas (paginação, usado com limite)
+    """
     try:
-        db = get_db()
-        session = db.get_session()
-        
-        query = text(f"""
-        SELECT * FROM docs_para_erp 
-        WHERE date(time_stamp) BETWEEN '{data_inicio}' AND '{data_fim}'
+        where, params = _where_docs(data_inicio, data_fim, emitente, destinatario, status_erp)
+        select = ", ".join(colunas) if colunas else "*"
+        query = f"""
+        SELECT {select} FROM docs_para_erp 
+        WHERE {where}
         ORDER BY time_stamp DESC
-        """)
-        
-        df = pd.read_sql_query(query, session.bind)
-        session.close()
+        """
+        if limite:
+            query += " LIMIT :limite OFFSET :offset"
+            params['limite'] = limite
+            params['offset'] = offset
         
-        # Converter colunas de data
+        # Datas convertidas durante a leitura
         date_columns = ['time_stamp', 'data_emissao', 'data_saida_entrada']
-        for col in date_columns:
-            if col in df.columns:
-                df[col] = pd.to_datetime(df[col], errors='coerce')
-        
-        return df
+        if colunas:
+            date_columns = [col for col in date_columns if col in colunas]
+        return _ler_sql(
+            query, params, versao_dados('docs_para_erp'),
+            parse_dates={col: PARSE_DATA_ISO for col in date_columns}
+        )
             
     except Exception as e:
         st.error(f"❌ Erro ao carregar docs_para_erp: {e}")
         return pd.DataFrame()
 
 
+def load_resumo_docs(data_inicio: str, data_fim: str, emitente: str = 'Todos',
+                     destinatario: str = 'Todos', status_erp: str = 'Todos') -> dict:
+    """Total de documentos, valor total e status ERP calculados no SQL (uma linha)"""
+    try:
+        where, params = _where_docs(data_inicio, data_fim, emitente, destinatario, status_erp)
+        resumo = _ler_sql(f"""
+        SELECT
+            COUNT(*) as total,
+            COALESCE(SUM(valor_total), 0) as valor_total,
+            COALESCE(SUM(erp_processado = 'Yes'), 0) as processados
+        FROM docs_para_erp
+        WHERE {where}
+        """, params, versao_dados('docs_para_erp')).iloc[0]
+        
+        return {
+            'total': int(resumo['total']),
+            'valor_total': float(resumo['valor_total']),
+            'processados': int(resumo['processados']),
+            'pendentes': int(resumo['total'] - resumo['processados']),
+        }
+    except Exception as e:
+        st.error(f"❌ Erro ao calcular resumo de docs_para_erp: {e}")
+        return {'total': 0, 'valor_total': 0.0, 'processados': 0, 'pendentes': 0}
+
+
+def load_opcoes_docs(coluna: str, data_inicio: str, data_fim: str) -> list:
+    """Valores distintos de `coluna` no período (opções dos filtros adicionais)"""
+    if coluna not in COLUNAS_FILTRO_DOCS:
+        raise ValueError(f"Coluna de filtro inválida: {coluna}")
+    
+    try:
+        df = _ler_sql(f"""
+        SELECT DISTINCT {coluna} FROM docs_para_erp
+        WHERE {FILTRO_PERIODO} AND {coluna} IS NOT NULL
+        ORDER BY {coluna}
+        """, _params_periodo(data_inicio, data_fim), versao_dados('docs_para_erp'))
+        return df[coluna].tolist()
+    except Exception as e:
+        st.error(f"❌ Erro ao carregar opções de {coluna}: {e}")
+        return []
+
+
 def load_registo_resultados(data_inicio: str, data_fim: str) -> pd.DataFrame:
     """Carrega dados da tabela registo_resultados com filtro de período"""
     try:
-        db = get_db()
-        session = db.get_session()
-        
-        query = text(f"""
-        SELECT * FROM registo_resultados 
-        WHERE date(time_stamp) BETWEEN '{data_inicio}' AND '{data_fim}'
+        # resultado/causa repetem-se muito: lidas diretamente como category
+        return _ler_sql(f"""
+        SELECT {", ".join(COLUNAS_REGISTO)} FROM registo_resultados 
+        WHERE {FILTRO_PERIODO}
         ORDER BY time_stamp DESC
-        """)
-        
-        df = pd.read_sql_query(query, session.bind)
-        session.close()
-        
-        # Converter coluna de data
-        if 'time_stamp' in df.columns:
-            df['time_stamp'] = pd.to_datetime(df['time_stamp'], errors='coerce')
-        
-        return df
+        """, _params_periodo(data_inicio, data_fim), versao_dados('registo_resultados'),
+            parse_dates={'time_stamp': PARSE_DATA_ISO},
+            dtype={'resultado': 'category', 'causa': 'category'}
+        )
             
     except Exception as e:
         st.error(f"❌ Erro ao carregar registo_resultados: {e}")
         return pd.DataFrame()
 
 
+def to_csv(df: pd.DataFrame) -> bytes:
+    """Converte DataFrame para CSV (bytes UTF-8, escrito por blocos sem string intermédia)"""
+    output = BytesIO()
+    df.to_csv(output, index=False, encoding='utf-8', chunksize=10_000)
+    return output.getvalue()
+
+
 def to_excel(df: pd.DataFrame) -> bytes:
-    """Converte DataFrame para Excel (bytes)"""
+    """
+    Converte DataFrame para Excel (bytes)
+    As linhas são escritas uma a uma em modo de streaming: constant_memory no
+    XlsxWriter, write_only no openpyxl (sem o modelo de células em memória).
+    O df.to_excel do pandas escreve coluna a coluna, o que estes modos não suportam.
+    """
     output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Dados')
+    
+    # Valores Python nativos, com NaN/NaT como células vazias
+    linhas = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+    
+    if xlsxwriter is None:
+        # openpyxl só é importado quando é mesmo usado
+        import openpyxl
+        from openpyxl.cell import WriteOnlyCell
+        
+        def texto_excel(valor):
+            """Texto começado por '=' fica como texto (como strings_to_formulas=False)"""
+            if isinstance(valor, str) and valor.startswith('='):
+                celula = WriteOnlyCell(worksheet, valor)
+                celula.data_type = 's'
+                return celula
+            return valor
+        
+        workbook = openpyxl.Workbook(write_only=True)
+        worksheet = workbook.create_sheet('Dados')
+        worksheet.append(df.columns.tolist())
+        for linha in linhas:
+            worksheet.append([texto_excel(v) for v in linha])
+        workbook.save(output)
+        return output.getvalue()
+    
+    workbook = xlsxwriter.Workbook(output, {
+        'constant_memory': True,
+        'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+        'strings_to_formulas': False,
+        'strings_to_urls': False,
+    })
+    worksheet = workbook.add_worksheet('Dados')
+    worksheet.write_row(0, 0, df.columns.tolist())
+    
+    for idx, linha in enumerate(linhas, 1):
+        worksheet.write_row(idx, 0, linha)
+    
+    workbook.close()
     return output.getvalue()
 
 
@@ -119,6 +290,12 @@ def format_currency(value) -> str:
         return "R$ 0,00"
 
 
+# Formatação das tabelas feita no browser: as colunas mantêm dtypes nativos
+# (datas e valores continuam ordenáveis e o payload Arrow é mais pequeno)
+COLUNA_DATA_HORA = st.column_config.DatetimeColumn(format="DD/MM/YYYY HH:mm")
+COLUNA_VALOR = st.column_config.NumberColumn("valor_total (R$)", format="localized")
+
+
 # ==================== FILTRO DE PERÍODO GLOBAL ====================
 
 st.markdown("### 📅 Período de Análise")
@@ -165,138 +342,162 @@ st.markdown("---")
 
 # ==================== TABELA: DOCS_PARA_ERP ====================
 
-if selected_tab == "📄 Documentos para ERP":
+# Cada tabela é um fragmento: filtros, paginação e exportação reexecutam
+# só a própria secção; período e seleção de tabela reexecutam a página
+
+def seletor_pagina(total: int, chave_consulta: tuple, key: str) -> int:
+    """
+    Navegação por páginas de LINHAS_POR_PAGINA linhas - retorna a página (1..n)
+    Volta à primeira página quando `chave_consulta` (período/filtros) muda
+    """
+    if total <= LINHAS_POR_PAGINA:
+        return 1
+    
+    total_paginas = -(-total // LINHAS_POR_PAGINA)
+    
+    if st.session_state.get(f"{key}_consulta") != chave_consulta:
+        st.session_state[f"{key}_consulta"] = chave_consulta
+        st.session_state[key] = 1
+    
+    col1, col2 = st.columns([3, 1])
+    with col2:
+        pagina = st.number_input(
+            f"Página (de {total_paginas:,})", min_value=1, max_value=total_paginas, key=key
+        )
+    with col1:
+        inicio = (pagina - 1) * LINHAS_POR_PAGINA
+        fim = min(inicio + LINHAS_POR_PAGINA, total)
+        st.caption(f"A mostrar registos {inicio + 1:,}-{fim:,} de {total:,}")
+    
+    return pagina
+
+
+@st.fragment
+def render_docs_para_erp(data_inicio_str: str, data_fim_str: str):
+    """Secção docs_para_erp: indicadores, filtros, tabela e exportação"""
     st.subheader("📄 Documentos para ERP")
     
     with st.spinner("🔄 Carregando dados..."):
-        df = load_docs_para_erp(str(data_inicio_global), str(data_fim_global))
+        resumo = load_resumo_docs(data_inicio_str, data_fim_str)
     
-    if df.empty:
+    if resumo['total'] == 0:
         show_info("Nenhum documento encontrado no período selecionado.", "💡 Ajuste as datas ou use a página **📤 Upload** para processar ficheiros.")
     else:
         # ==================== ESTATÍSTICAS ====================
         col1, col2, col3, col4 = st.columns(4)
         
         with col1:
-            st.metric("📝 Total Documentos", f"{len(df):,}")
+            st.metric("📝 Total Documentos", f"{resumo['total']:,}")
         
         with col2:
-            total_valor = df['valor_total'].sum() if 'valor_total' in df.columns else 0
-            st.metric("💰 Valor Total", format_currency(total_valor))
+            st.metric("💰 Valor Total", format_currency(resumo['valor_total']))
         
         with col3:
-            processados = len(df[df['erp_processado'] == 'Yes']) if 'erp_processado' in df.columns else 0
-            st.metric("✅ Processados ERP", f"{processados:,}")
+            st.metric("✅ Processados ERP", f"{resumo['processados']:,}")
         
         with col4:
-            pendentes = len(df[df['erp_processado'] != 'Yes']) if 'erp_processado' in df.columns else 0
-            st.metric("⏳ Pendentes ERP", f"{pendentes:,}")
+            st.metric("⏳ Pendentes ERP", f"{resumo['pendentes']:,}")
         
         st.markdown("---")
         
         # ==================== FILTROS ADICIONAIS ====================
+        # Escolhidos antes da leitura: são aplicados no WHERE da query
         with st.expander("🔍 Filtros Adicionais", expanded=False):
             col1, col2, col3 = st.columns(3)
             
-            df_filtered = df.copy()
-            
             # Filtro: Emitente
             with col1:
-                if 'razao_social_emitente' in df.columns:
-                    emitentes = ['Todos'] + sorted(df['razao_social_emitente'].dropna().unique().tolist())
-                    emitente_filtro = st.selectbox("Emitente", emitentes)
-                    if emitente_filtro != 'Todos':
-                        df_filtered = df_filtered[df_filtered['razao_social_emitente'] == emitente_filtro]
+                emitentes = ['Todos'] + load_opcoes_docs('razao_social_emitente', data_inicio_str, data_fim_str)
+                emitente_filtro = st.selectbox("Emitente", emitentes)
             
             # Filtro: Destinatário
             with col2:
-                if 'razao_social_destinatario' in df.columns:
-                    destinatarios = ['Todos'] + sorted(df['razao_social_destinatario'].dropna().unique().tolist())
-                    dest_filtro = st.selectbox("Destinatário", destinatarios)
-                    if dest_filtro != 'Todos':
-                        df_filtered = df_filtered[df_filtered['razao_social_destinatario'] == dest_filtro]
+                destinatarios = ['Todos'] + load_opcoes_docs('razao_social_destinatario', data_inicio_str, data_fim_str)
+                dest_filtro = st.selectbox("Destinatário", destinatarios)
             
             # Filtro: Status ERP
             with col3:
-                if 'erp_processado' in df.columns:
-                    status_erp = st.selectbox("Status ERP", ['Todos', 'Yes', 'No'])
-                    if status_erp != 'Todos':
-                        df_filtered = df_filtered[df_filtered['erp_processado'] == status_erp]
+                status_erp = st.selectbox("Status ERP", ['Todos', 'Yes', 'No'])
             
-            if len(df_filtered) != len(df):
-                st.info(f"🔍 Filtros aplicados: {len(df_filtered)} de {len(df)} registos")
+            filtros = (emitente_filtro, dest_filtro, status_erp)
             
-            df = df_filtered
+            if filtros != ('Todos', 'Todos', 'Todos'):
+                total_filtrado = load_resumo_docs(data_inicio_str, data_fim_str, *filtros)['total']
+                st.info(f"🔍 Filtros aplicados: {total_filtrado} de {resumo['total']} registos")
+            else:
+                total_filtrado = resumo['total']
         
         # ==================== TABELA ====================
         st.markdown("### 📊 Dados")
         
-        # Selecionar colunas principais para exibição
-        display_cols = [
-            'numero_nf', 'chave_acesso', 'razao_social_emitente', 
-            'razao_social_destinatario', 'valor_total', 'data_emissao',
-            'uf_emitente', 'erp_processado', 'time_stamp'
-        ]
-        
-        # Filtrar apenas colunas que existem
-        display_cols = [col for col in display_cols if col in df.columns]
-        
-        df_display = df[display_cols].copy() if display_cols else df.copy()
-        
-        # Formatar datas
-        for col in ['time_stamp', 'data_emissao', 'data_saida_entrada']:
-            if col in df_display.columns and pd.api.types.is_datetime64_any_dtype(df_display[col]):
-                df_display[col] = df_display[col].dt.strftime('%d/%m/%Y %H:%M')
+        pagina = seletor_pagina(
+            total_filtrado, (data_inicio_str, data_fim_str) + filtros, key="docs_pagina"
+        )
         
-        # Formatar valores monetários
-        if 'valor_total' in df_display.columns:
-            df_display['valor_total'] = df_display['valor_total'].apply(format_currency)
+        # Só as colunas e as linhas da página são lidas da BD
+        df_display = load_docs_para_erp(
+            data_inicio_str, data_fim_str, *filtros,
+            colunas=COLUNAS_EXIBICAO_DOCS, limite=LINHAS_POR_PAGINA,
+            offset=(pagina - 1) * LINHAS_POR_PAGINA
+        )
         
         st.dataframe(
             df_display,
             width="stretch",
             hide_index=True,
-            height=400
+            height=400,
+            column_config={
+                'time_stamp': COLUNA_DATA_HORA,
+                'data_emissao': COLUNA_DATA_HORA,
+                'valor_total': COLUNA_VALOR,
+            }
         )
         
         # ==================== EXPORTAÇÃO ====================
         st.markdown("---")
         st.markdown("### 📥 Exportar Dados")
         
-        col1, col2, col3 = st.columns([1, 1, 2])
-        
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        
-        with col1:
-            csv_data = df.to_csv(index=False).encode('utf-8')
-            st.download_button(
-                label="📄 Baixar CSV",
-                data=csv_data,
-                file_name=f"docs_erp_{timestamp}.csv",
-                mime="text/csv",
-                width="stretch"
-            )
-        
-        with col2:
-            excel_data = to_excel(df)
-            st.download_button(
-                label="📊 Baixar XLSX",
-                data=excel_data,
-                file_name=f"docs_erp_{timestamp}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                width="stretch"
-            )
-        
-        with col3:
-            st.info(f"✅ {len(df):,} registos prontos para exportação")
+        # Exportação leva todas as colunas e linhas filtradas: só é lida a pedido
+        if st.checkbox(f"Preparar exportação ({total_filtrado:,} registos, todas as colunas)", key="docs_exportar"):
+            with st.spinner("🔄 Preparando exportação..."):
+                df = load_docs_para_erp(data_inicio_str, data_fim_str, *filtros)
+            
+            col1, col2, col3 = st.columns([1, 1, 2])
+            
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            
+            with col1:
+                csv_data = to_csv(df)
+                st.download_button(
+                    label="📄 Baixar CSV",
+                    data=csv_data,
+                    file_name=f"docs_erp_{timestamp}.csv",
+                    mime="text/csv",
+                    width="stretch"
+                )
+            
+            with col2:
+                excel_data = to_excel(df)
+                st.download_button(
+                    label="📊 Baixar XLSX",
+                    data=excel_data,
+                    file_name=f"docs_erp_{timestamp}.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    width="stretch"
+                )
+            
+            with col3:
+                st.info(f"✅ {len(df):,} registos prontos para exportação")
 
 # ==================== TABELA: REGISTO_RESULTADOS ====================
 
-else:  # "📋 Registo de Resultados"
+@st.fragment
+def render_registo_resultados(data_inicio_str: str, data_fim_str: str):
+    """Secção registo_resultados: indicadores, filtros, tabela e exportação"""
     st.subheader("📋 Registo de Resultados")
     
     with st.spinner("🔄 Carregando dados..."):
-        df = load_registo_resultados(str(data_inicio_global), str(data_fim_global))
+        df = load_registo_resultados(data_inicio_str, data_fim_str)
     
     if df.empty:
         show_info("Nenhum registo encontrado no período selecionado.", "💡 Ajuste as datas ou verifique se há processamentos neste período.")
@@ -304,19 +505,23 @@ else:  # "📋 Registo de Resultados"
         # ==================== ESTATÍSTICAS ====================
         col1, col2, col3, col4 = st.columns(4)
         
+        # Contagem por resultado numa só passagem (sobre os códigos da category)
+        if 'resultado' in df.columns:
+            contagem_resultados = df['resultado'].value_counts()
+        
         with col1:
             st.metric("📝 Total Registos", f"{len(df):,}")
         
         with col2:
             if 'resultado' in df.columns:
-                sucessos = len(df[df['resultado'] == 'SUCESSO'])
+                sucessos = int(contagem_resultados.get('SUCESSO', 0))
                 st.metric("✅ Sucessos", f"{sucessos:,}")
             else:
                 st.metric("✅ Sucessos", "N/A")
         
         with col3:
             if 'resultado' in df.columns:
-                erros = len(df[df['resultado'] == 'ERRO'])
+                erros = int(contagem_resultados.get('ERRO', 0))
                 st.metric("❌ Erros", f"{erros:,}")
             else:
                 st.metric("❌ Erros", "N/A")
@@ -334,51 +539,67 @@ else:  # "📋 Registo de Resultados"
         with st.expander("🔍 Filtros Adicionais", expanded=False):
             col1, col2 = st.columns(2)
             
-            df_filtered = df.copy()
+            # Filtros combinados numa só máscara; o DataFrame é recortado uma vez
+            filtro = pd.Series(True, index=df.index)
+            resultado_filtro = causa_filtro = 'Todos'
             
+            # Opções = categorias (lidas como category: já são os valores distintos,
+            # sem nulos e já ordenados - não é preciso unique()/sorted())
             # Filtro: Resultado
             with col1:
                 if 'resultado' in df.columns:
-                    resultados = ['Todos'] + sorted(df['resultado'].dropna().unique().tolist())
+                    resultados = ['Todos'] + df['resultado'].cat.categories.tolist()
                     resultado_filtro = st.selectbox("Resultado", resultados)
                     if resultado_filtro != 'Todos':
-                        df_filtered = df_filtered[df_filtered['resultado'] == resultado_filtro]
+                        filtro &= df['resultado'].eq(resultado_filtro)
             
             # Filtro: Causa
             with col2:
                 if 'causa' in df.columns:
-                    causas = ['Todos'] + sorted(df['causa'].dropna().unique().tolist())
+                    causas = ['Todos'] + df['causa'].cat.categories.tolist()
                     causa_filtro = st.selectbox("Causa", causas)
                     if causa_filtro != 'Todos':
-                        df_filtered = df_filtered[df_filtered['causa'] == causa_filtro]
+                        filtro &= df['causa'].eq(causa_filtro)
             
-            if len(df_filtered) != len(df):
-                st.info(f"🔍 Filtros aplicados: {len(df_filtered)} de {len(df)} registos")
-            
-            df = df_filtered
+            total_filtrado = int(filtro.sum())
+            if total_filtrado != len(df):
+                st.info(f"🔍 Filtros aplicados: {total_filtrado} de {len(df)} registos")
+                df = df[filtro]
         
         # ==================== TABELA ====================
         st.markdown("### 📊 Dados")
         
-        # Preparar DataFrame para exibição
-        df_display = df.copy()
+        pagina = seletor_pagina(
+            len(df), (data_inicio_str, data_fim_str, resultado_filtro, causa_filtro),
+            key="registo_pagina"
+        )
+        
+        # Só a página atual é formatada e enviada; a exportação usa o df completo
+        inicio = (pagina - 1) * LINHAS_POR_PAGINA
+        df_pagina = df.iloc[inicio:inicio + LINHAS_POR_PAGINA]
         
-        # Formatar datas
-        if 'time_stamp' in df_display.columns and pd.api.types.is_datetime64_any_dtype(df_display['time_stamp']):
-            df_display['time_stamp'] = df_display['time_stamp'].dt.strftime('%d/%m/%Y %H:%M')
+        # Preparar DataFrame para exibição (só as colunas mostradas, sem copiar o resto)
+        colunas_display = {}
+        
+        if 'time_stamp' in df_pagina.columns:
+            colunas_display['time_stamp'] = df_pagina['time_stamp']
         
         # Simplificar path
-        if 'path_nome_arquivo' in df_display.columns:
-            df_display['arquivo'] = df_display['path_nome_arquivo'].apply(lambda x: Path(x).name if x else '')
-            cols = ['time_stamp', 'arquivo', 'resultado', 'causa']
-            cols = [c for c in cols if c in df_display.columns]
-            df_display = df_display[cols]
+        if 'path_nome_arquivo' in df_pagina.columns:
+            colunas_display['arquivo'] = df_pagina['path_nome_arquivo'].apply(lambda x: Path(x).name if x else '')
+        
+        for col in ['resultado', 'causa']:
+            if col in df_pagina.columns:
+                colunas_display[col] = df_pagina[col]
+        
+        df_display = pd.DataFrame(colunas_display)
         
         st.dataframe(
             df_display,
             width="stretch",
             hide_index=True,
-            height=400
+            height=400,
+            column_config={'time_stamp': COLUNA_DATA_HORA}
         )
         
         # ==================== EXPORTAÇÃO ====================
@@ -390,7 +611,7 @@ else:  # "📋 Registo de Resultados"
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         
         with col1:
-            csv_data = df.to_csv(index=False).encode('utf-8')
+            csv_data = to_csv(df)
             st.download_button(
                 label="📄 Baixar CSV",
                 data=csv_data,
@@ -412,6 +633,13 @@ else:  # "📋 Registo de Resultados"
         with col3:
             st.info(f"✅ {len(df):,} registos prontos para exportação")
 
+# ==================== TABELA SELECIONADA ====================
+
+if selected_tab == "📄 Documentos para ERP":
+    render_docs_para_erp(str(data_inicio_global), str(data_fim_global))
+else:  # "📋 Registo de Resultados"
+    render_registo_resultados(str(data_inicio_global), str(data_fim_global))
+
 # ==================== SIDEBAR ====================
 
 with st.sidebar:
@@ -436,6 +664,7 @@ with st.sidebar:
     """)
     
     if st.button("🔄 Atualizar Dados", width="stretch"):
+        _ler_sql.clear()
         st.rerun()
 
 # ==================== FOOTER ====================
@@ -0,0 +1,133 @@
+"""
+Testes das operações em lote do DatabaseManager
+Execute: pytest tests/test_db_manager.py -v
+"""
+
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+# Adicionar raiz do projeto ao path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import src.utils.config as config
+import src.database.db_manager as db_manager
+from src.database.db_manager import DatabaseManager
+from src.database.models import RegistroResultado
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """DatabaseManager novo, com a BD SQLite (data/) e as pastas dentro de tmp_path"""
+    monkeypatch.delenv('DATABASE_URL', raising=False)
+    monkeypatch.delenv('RAILWAY_ENVIRONMENT', raising=False)
+    monkeypatch.chdir(tmp_path)
+
+    # Singletons: configurações e gestor da BD recriados para tmp_path
+    monkeypatch.setattr(config, '_settings', None)
+    monkeypatch.setattr(db_manager, '_db_manager', None)
+    monkeypatch.setattr(DatabaseManager, '_instance', None)
+    monkeypatch.setattr(DatabaseManager, '_engine', None)
+    monkeypatch.setattr(DatabaseManager, '_SessionLocal', None)
+
+    manager = DatabaseManager()
+    yield manager
+    manager.engine.dispose()
+
+
+def documento(chave: str, arquivo: str) -> dict:
+    """Dados mínimos de uma linha de docs_para_erp"""
+    return {
+        'chave_acesso': chave,
+        'numero_nf': chave[-4:],
+        'data_emissao': datetime(2024, 1, 15),
+        'valor_total': 100.0,
+        'path_nome_arquivo': arquivo,
+    }
+
+
+class TestAddResultadosBulk:
+    """Testes de add_resultados_bulk"""
+
+    def test_insere_todos_numa_transacao(self, db):
+        """Insere todas as linhas e incrementa a versão da tabela uma vez"""
+        resultados = [
+            {'time_stamp': datetime.now(), 'path_nome_arquivo': f'upload/nf{i}.xml',
+             'resultado': 'ERRO', 'causa': f'causa {i}'}
+            for i in range(3)
+        ]
+
+        assert db.add_resultados_bulk(resultados) == 3
+        assert db.count_results() == 3
+        assert db.get_versao_dados(RegistroResultado.__tablename__) == 1
+
+        session = db.get_session()
+        try:
+            causas = sorted(r.causa for r in session.query(RegistroResultado).all())
+        finally:
+            session.close()
+        assert causas == ['causa 0', 'causa 1', 'causa 2']
+
+    def test_lista_vazia(self, db):
+        """Lista vazia não escreve nem muda a versão"""
+        assert db.add_resultados_bulk([]) == 0
+        assert db.count_results() == 0
+        assert db.get_versao_dados(RegistroResultado.__tablename__) == 0
+
+    def test_erro_nao_grava_nada(self, db):
+        """Uma linha inválida desfaz o lote inteiro"""
+        resultados = [
+            {'time_stamp': datetime.now(), 'path_nome_arquivo': 'upload/ok.xml',
+             'resultado': 'Sucesso', 'causa': None},
+            {'time_stamp': datetime.now(), 'path_nome_arquivo': None,
+             'resultado': 'ERRO', 'causa': 'sem ficheiro'},
+        ]
+
+        assert db.add_resultados_bulk(resultados) == 0
+        assert db.count_results() == 0
+        assert db.get_versao_dados(RegistroResultado.__tablename__) == 0
+
+
+class TestGetDocumentosByChaves:
+    """Testes de get_documentos_by_chaves"""
+
+    def test_devolve_so_existentes(self, db):
+        """Mapeia chave -> ficheiro apenas para as chaves que existem"""
+        assert db.add_documento(documento('1' * 44, 'arquivos/a.xml'))
+        assert db.add_documento(documento('2' * 44, 'arquivos/b.xml'))
+
+        encontrados = db.get_documentos_by_chaves(['1' * 44, '3' * 44, '2' * 44, '1' * 44])
+
+        assert encontrados == {'1' * 44: 'arquivos/a.xml', '2' * 44: 'arquivos/b.xml'}
+
+    def test_sem_chaves(self, db):
+        """Lista vazia ou sem correspondências devolve {}"""
+        assert db.get_documentos_by_chaves([]) == {}
+        assert db.get_documentos_by_chaves(['9' * 44]) == {}
+
+
+class TestProcessFileResultadosPendentes:
+    """Resultados do NFeProcessor acumulados para gravação em lote"""
+
+    def test_acumula_sem_gravar(self, db):
+        """Com resultados_pendentes, process_file não grava o resultado na BD"""
+        from src.processors.nfe_processor import NFeProcessor
+
+        processor = NFeProcessor()
+        arquivo = Path(processor.settings.pasta_entrados) / 'nota.txt'
+        arquivo.write_text('não é XML')
+
+        pendentes = []
+        resultado = processor.process_file(arquivo, resultados_pendentes=pendentes)
+
+        assert resultado['success'] is False
+        assert db.count_results() == 0
+        assert len(pendentes) == 1
+        assert pendentes[0]['resultado'] == 'Insucesso'
+        assert pendentes[0]['causa'] == 'Extensão inválida'
+        assert isinstance(pendentes[0]['time_stamp'], datetime)
+
+        assert db.add_resultados_bulk(pendentes) == 1
+        assert db.count_results() == 1
@@ -0,0 +1,105 @@
+"""
+Testes da análise de SQL direto (página Consultas)
+Execute: pytest tests/test_sql_direto.py -v
+"""
+
+import sys
+import time
+from pathlib import Path
+
+# Adicionar raiz do projeto ao path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.utils.sql_direto import dividir_sql, tipo_statement, projetar_colunas
+
+
+class TestDividirSql:
+    """Testes de dividir_sql"""
+
+    def test_statement_unica(self):
+        """Uma statement, com ou sem ';' final"""
+        assert dividir_sql("SELECT 1") == ["SELECT 1"]
+        assert dividir_sql("  SELECT 1 ;  ") == ["SELECT 1"]
+
+    def test_varias_statements(self):
+        """Separa por ';' e ignora statements vazias"""
+        assert dividir_sql("SELECT 1; ;DELETE FROM t;") == ["SELECT 1", "DELETE FROM t"]
+
+    def test_ponto_e_virgula_em_literais(self):
+        """';' dentro de literais não divide (incluindo aspas duplicadas)"""
+        assert dividir_sql("SELECT 'a;b' FROM t") == ["SELECT 'a;b' FROM t"]
+        assert dividir_sql('SELECT "x;y" FROM t') == ['SELECT "x;y" FROM t']
+        assert dividir_sql("SELECT 'it''s; ok'; SELECT 2") == ["SELECT 'it''s; ok'", "SELECT 2"]
+
+    def test_ponto_e_virgula_em_comentarios(self):
+        """';' dentro de comentários não divide"""
+        assert dividir_sql("SELECT 1 -- a;b\nFROM t") == ["SELECT 1 -- a;b\nFROM t"]
+        assert dividir_sql("SELECT /* ; */ 1") == ["SELECT /* ; */ 1"]
+
+    def test_literal_ou_comentario_por_fechar(self):
+        """Literal/comentário por fechar vai até ao fim do texto"""
+        assert dividir_sql("SELECT 'abc; DELETE FROM t") == ["SELECT 'abc; DELETE FROM t"]
+        assert dividir_sql("SELECT 1 /* ; DELETE FROM t") == ["SELECT 1 /* ; DELETE FROM t"]
+
+    def test_vazio(self):
+        """Texto vazio ou só espaços não tem statements"""
+        assert dividir_sql("") == []
+        assert dividir_sql("  ;  ; ") == []
+
+
+class TestTipoStatement:
+    """Testes de tipo_statement"""
+
+    def test_primeira_palavra(self):
+        """Devolve a primeira palavra em maiúsculas"""
+        assert tipo_statement("select * from t") == "SELECT"
+        assert tipo_statement("  DELETE FROM t") == "DELETE"
+        assert tipo_statement("WITH x AS (SELECT 1) SELECT * FROM x") == "WITH"
+
+    def test_salta_comentarios(self):
+        """Comentários iniciais não contam como palavra-chave"""
+        assert tipo_statement("-- comentário\nSELECT 1") == "SELECT"
+        assert tipo_statement("/* SELECT */ DELETE FROM t") == "DELETE"
+        assert tipo_statement("/* a */ -- b\n  /* c */ update t set x = 1") == "UPDATE"
+
+    def test_palavra_dentro_de_comentario_nao_conta(self):
+        """Sem palavra-chave após os comentários, não devolve texto do comentário"""
+        assert tipo_statement("-- SELECT\n(DELETE FROM t)") == ""
+        assert tipo_statement("/* SELECT */ (1)") == ""
+        assert tipo_statement("/* SELECT por fechar") == ""
+
+    def test_sem_palavra(self):
+        """Sem palavra-chave devolve ''"""
+        assert tipo_statement("") == ""
+        assert tipo_statement("(SELECT 1)") == ""
+
+    def test_tempo_linear(self):
+        """Prefixos longos de espaços/comentários não causam retrocesso exponencial"""
+        inicio = time.perf_counter()
+        assert tipo_statement("/**/" + " " * 50_000 + "(SELECT 1)") == ""
+        assert tipo_statement("-- x\n" * 10_000 + "(SELECT 1)") == ""
+        assert tipo_statement("/* a */ " * 10_000 + "(SELECT 1)") == ""
+        assert time.perf_counter() - inicio < 1.0
+
+
+class TestProjetarColunas:
+    """Testes de projetar_colunas"""
+
+    COLUNAS = ('numero_nf', 'valor_total')
+
+    def test_select_todos(self):
+        """`SELECT *` sobre docs_para_erp é reescrito com as colunas indicadas"""
+        assert (
+            projetar_colunas("select * from docs_para_erp where valor_total > 10", self.COLUNAS)
+            == "SELECT numero_nf, valor_total from docs_para_erp where valor_total > 10"
+        )
+
+    def test_outras_consultas_inalteradas(self):
+        """Outras tabelas, colunas explícitas ou * fora do início ficam iguais"""
+        for consulta in (
+            "SELECT * FROM registo_resultados",
+            "SELECT * FROM docs_para_erp_backup",
+            "SELECT numero_nf FROM docs_para_erp",
+            "SELECT COUNT(*) FROM docs_para_erp",
+        ):
+            assert projetar_colunas(consulta, self.COLUNAS) == consulta
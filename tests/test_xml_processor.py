@@ -30,6 +30,19 @@ class TestXMLProcessor:
         processor = XMLProcessor()
         assert hasattr(processor, '_detect_doc_type')
 
+    def test_descarregar(self):
+        """Testa que descarregar liberta os bytes e a árvore do XML"""
+        processor = XMLProcessor()
+        conteudo = b'<?xml version="1.0"?><nfeProc><NFe><infNFe/></NFe></nfeProc>'
+        assert processor.load_xml(Path("upload.xml"), conteudo)
+        assert processor.conteudo is conteudo
+
+        processor.descarregar()
+        assert processor.conteudo is None
+        assert processor.tree is None
+        assert processor.xml_root is None
+        assert processor.root is None
+
 
 class TestNFValidator:
     """Testes do validador"""